@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+import heapq
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import GameServer
+
+# Poprzednia implementacja GameServer.astar (kopiuje ścieżkę przy każdym push)
+def legacy_astar(start, goal, grid, grid_w, grid_h):
+    def heuristic(a, b):
+        return abs(a[0]-b[0]) + abs(a[1]-b[1])
+    open_set = []
+    heapq.heappush(open_set, (0+heuristic(start, goal), 0, start, [start]))
+    closed = set()
+    while open_set:
+        _, cost, current, path = heapq.heappop(open_set)
+        if current == goal:
+            return path
+        if current in closed:
+            continue
+        closed.add(current)
+        for dx, dy in [(-1,0),(1,0),(0,-1),(0,1)]:
+            nx, ny = current[0]+dx, current[1]+dy
+            if 0 <= nx < grid_w and 0 <= ny < grid_h and grid[nx][ny]==0:
+                heapq.heappush(open_set, (cost+1+heuristic((nx,ny), goal), cost+1, (nx,ny), path+[(nx,ny)]))
+    return None
+
+def random_free_cell(nav, rng):
+    while True:
+        gx = rng.randrange(nav.grid_w)
+        gy = rng.randrange(nav.grid_h)
+        if nav.grid[gx][gy] == 0:
+            return gx, gy
+
+def run(label, fn, pairs):
+    found = 0
+    start_time = time.perf_counter()
+    for start, goal in pairs:
+        if fn(start, goal):
+            found += 1
+    elapsed = time.perf_counter() - start_time
+    print(f"{label:<28} {elapsed / len(pairs) * 1000:8.3f} ms/search  ({found}/{len(pairs)} paths)")
+
+def main():
+    server = GameServer(port=0)
+    server.server.close()
+    nav = server.nav_grid
+    rng = random.Random(1)
+    pairs = [(random_free_cell(nav, rng), random_free_cell(nav, rng)) for _ in range(200)]
+    args = (nav.grid, nav.grid_w, nav.grid_h)
+    print(f"Map {nav.grid_w}x{nav.grid_h} cells, {len(pairs)} random start/goal pairs")
+    run("legacy (path copies)", lambda s, g: legacy_astar(s, g, *args), pairs)
+    run("astar 4-way", lambda s, g: server.astar(s, g, *args, diagonal=False, max_expansions=nav.grid_w * nav.grid_h), pairs)
+    run("astar 8-way", lambda s, g: server.astar(s, g, *args, max_expansions=nav.grid_w * nav.grid_h), pairs)
+    run("astar 8-way, default cap", lambda s, g: server.astar(s, g, *args), pairs)
+
+if __name__ == "__main__":
+    main()
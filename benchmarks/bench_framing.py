@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import socket
+import struct
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.network import NetworkProtocol, FrameBuffer
+
+# Odczyt strumienia ramek: dawny recv(4) + sklejanie kawałków po 4096 bajtów
+# kontra FrameBuffer (recv_into dużymi blokami, wszystkie ramki z odczytu)
+
+class CountingSocket:
+    def __init__(self, sock):
+        self.sock = sock
+        self.calls = 0
+
+    def recv(self, size):
+        self.calls += 1
+        return self.sock.recv(size)
+
+    def recv_into(self, buffer):
+        self.calls += 1
+        return self.sock.recv_into(buffer)
+
+def old_receive_frame(sock):
+    length_data = sock.recv(4)
+    if not length_data:
+        return None
+    message_length = struct.unpack('!I', length_data)[0]
+    message_data = b''
+    while len(message_data) < message_length:
+        chunk = sock.recv(min(message_length - len(message_data), 4096))
+        if not chunk:
+            return None
+        message_data += chunk
+    return message_data
+
+def old_reader(sock):
+    count = 0
+    while old_receive_frame(sock) is not None:
+        count += 1
+    return count
+
+def frame_buffer_reader(sock):
+    reader = FrameBuffer()
+    count = 0
+    while reader.recv_from(sock):
+        for payload in reader.frames():
+            count += 1
+    return count
+
+def run(reader, frame, count):
+    a, b = socket.socketpair()
+    stream = frame * count
+
+    def writer():
+        a.sendall(stream)
+        a.close()
+
+    thread = threading.Thread(target=writer)
+    counting = CountingSocket(b)
+    start_time = time.perf_counter()
+    thread.start()
+    received = reader(counting)
+    elapsed = time.perf_counter() - start_time
+    thread.join()
+    b.close()
+    assert received == count
+    return elapsed, counting.calls
+
+def main():
+    print(f"{'frame bytes':>11} {'reader':<12} {'ms':>8} {'recv calls':>11}")
+    # Delta w obszarze zainteresowania, pełny widok i cały świat z wieloma pociskami
+    for size, count in ((300, 20000), (3000, 5000), (60000, 300)):
+        frame = NetworkProtocol.encode_frame(bytes(size))
+        for label, reader in (("recv +=", old_reader), ("FrameBuffer", frame_buffer_reader)):
+            elapsed, calls = run(reader, frame, count)
+            print(f"{size:>11} {label:<12} {elapsed * 1000:>8.1f} {calls:>11}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+import random
+import math
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import GameServer
+from common.game_objects import Player, Enemy, LootBox, Mine, Pickup, WEAPON_LIST
+from common.network import NetworkProtocol
+from common.wire import PROTOCOL_PICKLE, PROTOCOL_BINARY
+
+# Typowy stan gry: mapa z serwera, 3 graczy, fala wrogów i trochę pocisków
+def build_state(rng):
+    server = GameServer(port=0)
+    server.server.close()
+    state = server.game_state
+    for pid in range(3):
+        player = Player(rng.uniform(100, 3900), rng.uniform(100, 2900), pid)
+        for weapon in WEAPON_LIST[1:]:
+            player.add_weapon(weapon)
+        state.players[pid] = player
+        state.scores[pid] = rng.randrange(0, 20000, 100)
+    for _ in range(10):
+        state.enemies.append(Enemy(rng.uniform(100, 3900), rng.uniform(100, 2900), rng.randint(1, 4)))
+    for _ in range(60):
+        state.bullets.spawn(rng.uniform(100, 3900), rng.uniform(100, 2900), rng.uniform(-math.pi, math.pi), rng.randrange(3))
+    for _ in range(5):
+        state.lootboxes.append(LootBox(rng.uniform(100, 3900), rng.uniform(100, 2900), rng.choice(WEAPON_LIST[1:])))
+    for pid in range(3):
+        state.mines.append(Mine(rng.uniform(100, 3900), rng.uniform(100, 2900), pid, 150))
+    state.pickups.append(Pickup(500, 500, 'health', 50))
+    state.pickups.append(Pickup(900, 700, 'armor', 50))
+    return server
+
+def timeit(fn, repeat):
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start_time) / repeat * 1e6
+
+def main():
+    rng = random.Random(1)
+    server = build_state(rng)
+    state = server.game_state
+    snapshot = {'type': 'game_state', 'data': state.to_dict()}
+    data = snapshot['data']
+    data['seq'] = 1
+    data['time'] = 0.0
+    print(f"Snapshot: {len(data['players'])} players, {len(data['enemies'])} enemies, {len(data['bullets'])} bullets, {len(data['walls'])} walls")
+    print(f"{'protocol':<10} {'bytes':>8} {'encode us':>10} {'decode us':>10}")
+    for label, protocol in (("pickle", PROTOCOL_PICKLE), ("binary", PROTOCOL_BINARY)):
+        payload = NetworkProtocol.create_message(snapshot['type'], snapshot['data'], protocol)
+        encode = timeit(lambda: NetworkProtocol.create_message(snapshot['type'], snapshot['data'], protocol), 500)
+        decode = timeit(lambda: NetworkProtocol.parse_message(payload, protocol), 500)
+        print(f"{label:<10} {len(payload) + 4:>8} {encode:>10.1f} {decode:>10.1f}")
+
+    # Wycinek stanu dla jednego gracza (obszar zainteresowania)
+    view = server.view_for_client(0, data)
+    payload = NetworkProtocol.create_message('game_state', view, PROTOCOL_BINARY)
+    decode = timeit(lambda: NetworkProtocol.parse_message(payload, PROTOCOL_BINARY), 500)
+    print(f"{'binary AOI':<10} {len(payload) + 4:>8} {'':>10} {decode:>10.1f}"
+          f"  ({len(view['enemies'])} enemies, {len(view['radar'])} radar, {len(view['bullets'])} bullets, {len(view['walls'])} walls)")
+
+    message = {'seq': 1, 'dx': 1, 'dy': 0, 'angle': 45.0, 'shoot': True, 'mouse_x': 812.5, 'mouse_y': 440.0, 'ack': 1}
+    for label, protocol in (("pickle", PROTOCOL_PICKLE), ("binary", PROTOCOL_BINARY)):
+        payload = NetworkProtocol.create_message('player_input', message, protocol)
+        print(f"player_input {label:<8} {len(payload) + 4:>4} bytes")
+
+if __name__ == "__main__":
+    main()
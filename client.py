@@ -1,15 +1,88 @@
 import sys
+import os
 import socket
 import pygame
 import math
+import time
+import threading
+from collections import deque
 from common.game_objects import Player, Enemy, Bullet, Wall, LootBox, Mine
-from common.network import NetworkProtocol, GameState
+from common.network import NetworkProtocol, FrameBuffer, UdpChannel, LossyLink, MAX_DATAGRAM_SIZE, GameState, SnapshotDelta, MapCache, SNAPSHOT_HISTORY
 
 SCREEN_WIDTH = 800 
 SCREEN_HEIGHT = 600
 
+class SnapshotBuffer:
+    # Snapshoty z czasem symulacji serwera. Rysujemy świat z chwili
+    # now - interp_delay, interpolując pozycje między dwoma otaczającymi
+    # snapshotami; przy krótkiej przerwie w pakietach ekstrapolujemy z dwóch
+    # ostatnich (najwyżej o max_extrapolation).
+    def __init__(self, interp_delay=0.1, max_extrapolation=0.1, size=16):
+        self.interp_delay = interp_delay * 1000
+        self.max_extrapolation = max_extrapolation * 1000
+        self.snapshots = deque(maxlen=size)
+        # Czas serwera - czas odbioru; największa wartość to najmniejsze opóźnienie
+        self.clock_offsets = deque(maxlen=32)
+        self._indexed = None
+        self._index = None
+
+    def add(self, snapshot, received_ms):
+        self.snapshots.append(snapshot)
+        self.clock_offsets.append(snapshot['time'] - received_ms)
+
+    def sample(self, now_ms):
+        # (a, b, t): stan do zastosowania i współczynnik interpolacji a -> b
+        if not self.snapshots:
+            return None
+        snaps = self.snapshots
+        newest = snaps[-1]
+        if len(snaps) == 1:
+            return newest, newest, 0.0
+        render_time = now_ms + max(self.clock_offsets) - self.interp_delay
+        render_time = min(render_time, newest['time'] + self.max_extrapolation)
+        a, b = snaps[-2], newest
+        for i in range(len(snaps) - 1):
+            if snaps[i + 1]['time'] >= render_time:
+                a, b = snaps[i], snaps[i + 1]
+                break
+        span = b['time'] - a['time']
+        t = (render_time - a['time']) / span if span > 0 else 1.0
+        return a, b, max(t, 0.0)
+
+    def interpolate(self, game_state, a, b, t):
+        if a is b:
+            return
+        if self._indexed != (a['seq'], b['seq']):
+            self._indexed = (a['seq'], b['seq'])
+            self._index = {name: ({r['id']: r for r in a[name]}, {r['id']: r for r in b[name]})
+                           for name in ('enemies', 'bullets')}
+        for pid, player in game_state.players.items():
+            pa = a['players'].get(pid)
+            pb = b['players'].get(pid)
+            if pa and pb and not pb['dead']:
+                player.x = pa['x'] + (pb['x'] - pa['x']) * t
+                player.y = pa['y'] + (pb['y'] - pa['y']) * t
+                turn = (pb['angle'] - pa['angle'] + 180) % 360 - 180
+                player.angle = pa['angle'] + turn * t
+        old, new = self._index['enemies']
+        for enemy in game_state.enemies:
+            ea = old.get(enemy.net_id)
+            eb = new.get(enemy.net_id)
+            if ea and eb:
+                enemy.x = ea['x'] + (eb['x'] - ea['x']) * t
+                enemy.y = ea['y'] + (eb['y'] - ea['y']) * t
+        old, new = self._index['bullets']
+        pool = game_state.bullets
+        for i, net_id in enumerate(pool.net_id[:pool.count].tolist()):
+            ba = old.get(net_id)
+            bb = new.get(net_id)
+            if ba and bb:
+                pool.x[i] = ba['x'] + (bb['x'] - ba['x']) * t
+                pool.y[i] = ba['y'] + (bb['y'] - ba['y']) * t
+
 class GameClient:
-    def __init__(self, server_ip, port=5555):
+    def __init__(self, server_ip, port=5555, cache_dir=os.path.join(os.path.expanduser('~'), '.boxhead_cache'), interp_delay=0.1,
+                 transport='tcp', udp_sim=None):
         pygame.init()
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
         pygame.display.set_caption("Boxhead Multiplayer")
@@ -19,10 +92,16 @@ class GameClient:
         # Connect to server
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket.connect((server_ip, port))
+        # Małe pakiety wejścia nie mogą czekać na algorytm Nagle'a
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.protocol = NetworkProtocol.client_handshake(self.socket)
+        join, self.static_walls = self.join(MapCache(cache_dir))
+        self.player_id = join['player_id']
         
         # Game state
         self.game_state = GameState()
-        self.player_id = None
+        self.snapshots = {}  # seq -> snapshot, bazy dla delt z serwera
+        self.last_snapshot_seq = 0
         self.keys = {
             'w': False,
             'a': False,
@@ -34,11 +113,45 @@ class GameClient:
         self.keyboard_target_pos = [SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2]
         self._keyboard_target_speed = 10
 
+        # Odbiór sieci w osobnym wątku, żeby pętla rysowania nie czekała na pakiety
+        self.incoming = deque(maxlen=16)  # (snapshot, czas odbioru w ms)
+        self.snapshot_buffer = SnapshotBuffer(interp_delay)
+        self.applied_seq = 0
+        # Przewidywanie własnego ruchu: wejścia wysłane, ale jeszcze
+        # niepotwierdzone przez serwer (seq, dx, dy, czas wysłania)
+        self.input_seq = 0
+        self.pending_inputs = deque()
+        self.predicted_angle = None
+        self.prediction_base = None
+        self.prediction_error = (0, 0)
+        # Niezmienione wejście powtarzamy co input_heartbeat (niesie też ack
+        # snapshotów, więc musi być częściej niż historia delt na serwerze)
+        self.input_heartbeat = 0.25
+        self.last_input_key = None
+        self.last_input_sent = 0
+        self.outbox = []  # Wiadomości z jednej klatki, wysyłane razem
+        # Wątki odbioru TCP i UDP składają snapshoty do wspólnej historii
+        self.receive_lock = threading.Lock()
+        self.udp_channel = None
+        self.udp_lock = threading.Lock()
+        self.input_redundancy = 3  # W ilu kolejnych klatkach wysyłamy wejście po UDP
+        self.input_repeat = 0  # W ilu klatkach jeszcze
+        # Niepotwierdzone wejścia; każdy datagram z wejściem niesie ostatnie z nich
+        self.unacked_inputs = deque(maxlen=8)
+        self.acked_input_seq = 0
+        if transport == 'udp':
+            if join['udp_port']:
+                self.open_udp(server_ip, join['udp_port'], join['udp_token'], udp_sim)
+            else:
+                print("Server does not offer UDP, staying on TCP")
+        self.receiver = threading.Thread(target=self.receive_loop, daemon=True)
+        self.receiver.start()
+
     def handle_input(self):
         for event in pygame.event.get():
             if getattr(self.game_state, 'game_over', False):
                 if event.type == pygame.KEYDOWN and event.key == pygame.K_r:
-                    NetworkProtocol.send_message(self.socket, {'type': 'restart_game', 'data': {}})
+                    self.outbox.append({'type': 'restart_game', 'data': {}})
                     return
             if self.player_id is not None and self.player_id in self.game_state.players:
                 player = self.game_state.players[self.player_id]
@@ -61,7 +174,7 @@ class GameClient:
                     if pygame.K_1 <= event.key <= pygame.K_9:
                         idx = event.key - pygame.K_1
                         if idx < len(player.weapons):
-                            NetworkProtocol.send_message(self.socket, {
+                            self.outbox.append({
                                 'type': 'switch_weapon',
                                 'data': {'selected_weapon_index': idx}
                             })
@@ -140,34 +253,227 @@ class GameClient:
                 angle = math.degrees(math.atan2(world_mouse_y - player.y, world_mouse_x - player.x))
                 shooting = pygame.mouse.get_pressed()[0] or pygame.key.get_pressed()[pygame.K_SPACE]
 
-        NetworkProtocol.send_message(self.socket, {
+        self.predicted_angle = angle
+        # Wysyłamy tylko zmianę wejścia (kąt co 1°, pozycja myszy co 8 px, gdy
+        # strzelamy) albo co input_heartbeat; serwer trzyma ostatnie wejście
+        now = time.time()
+        key = (dx, dy, bool(shooting), round(angle),
+               (round(world_mouse_x / 8), round(world_mouse_y / 8)) if shooting else None)
+        if key == self.last_input_key and now - self.last_input_sent < self.input_heartbeat:
+            return
+        self.last_input_key = key
+        self.last_input_sent = now
+        self.input_seq += 1
+        self.pending_inputs.append((self.input_seq, dx, dy, now))
+        self.outbox.append({
             'type': 'player_input',
             'data': {
+                'seq': self.input_seq,
                 'dx': dx,
                 'dy': dy,
                 'angle': angle,
                 'shoot': shooting,
                 'mouse_x': world_mouse_x,
-                'mouse_y': world_mouse_y
+                'mouse_y': world_mouse_y,
+                'ack': self.last_snapshot_seq
             }
         })
 
-    def update(self):
-        message = NetworkProtocol.receive_message(self.socket)
-        if message:
-            if message['type'] == 'game_state':
-                self.game_state = GameState.from_dict(message['data'])
-                if self.player_id is None and self.game_state.players:
-                    self.player_id = max(self.game_state.players.keys())
+    def flush_outbox(self):
+        if self.udp_channel is not None:
+            self.flush_udp()
+        elif self.outbox:
+            NetworkProtocol.send_messages(self.socket, self.outbox, self.protocol)
+        self.outbox = []
+
+    def flush_udp(self):
+        # Wejście idzie zawodnie w kilku kolejnych klatkach, razem z wcześniejszymi
+        # niepotwierdzonymi, żeby zgubiony datagram nie gubił zmiany wejścia
+        # (powtórki serwer rozpoznaje po seq); pozostałe wiadomości kanałem
+        # niezawodnym, a za duże na datagram po TCP
+        now = time.monotonic()
+        oversized = []
+        with self.udp_lock:
+            datagrams = []
+            for message in self.outbox:
+                if message['type'] == 'player_input':
+                    self.unacked_inputs.append(message['data'])
+                    self.input_repeat = self.input_redundancy
+                    continue
+                payload = NetworkProtocol.create_message(message['type'], message['data'], self.protocol)
+                if not self.udp_channel.fits(payload):
+                    oversized.append(message)
+                else:
+                    datagrams.append(self.udp_channel.reliable(payload, now))
+            while self.unacked_inputs and self.unacked_inputs[0]['seq'] <= self.acked_input_seq:
+                self.unacked_inputs.popleft()
+            if self.input_repeat and self.unacked_inputs:
+                payload = NetworkProtocol.create_message('player_inputs', {'inputs': list(self.unacked_inputs)}, self.protocol)
+                datagrams.append(self.udp_channel.unreliable(payload))
+                self.input_repeat -= 1
+            datagrams.extend(self.udp_channel.poll(now))
+        for datagram in datagrams:
+            try:
+                self.udp_send(datagram)
+            except ConnectionRefusedError:
+                pass
+        if oversized:
+            NetworkProtocol.send_messages(self.socket, oversized, self.protocol)
+
+    def join(self, map_cache):
+        message = NetworkProtocol.receive_message(self.socket, self.protocol)
+        if message is None or message['type'] != 'join':
+            raise ConnectionError("Server did not send join")
+        map_hash = message['data']['map_hash']
+        static_map = map_cache.load(map_hash)
+        NetworkProtocol.send_message(self.socket, {'type': 'join_ack', 'data': {'have_map': static_map is not None}}, self.protocol)
+        if static_map is None:
+            reply = NetworkProtocol.receive_message(self.socket, self.protocol)
+            if reply is None or reply['type'] != 'static_map':
+                raise ConnectionError("Server did not send static_map")
+            static_map = reply['data']
+            if map_cache.store(static_map) != map_hash:
+                print("Warning: map does not match the hash announced by the server")
+        static_walls = [GameState.wall_from_dict(w) for w in static_map['walls']]
+        return message['data'], static_walls
+
+    def open_udp(self, server_ip, udp_port, token, udp_sim=None):
+        # Snapshoty i wejście po UDP; serwer wiąże nasz adres z graczem po
+        # niezawodnym udp_hello, do tego czasu snapshoty idą jeszcze po TCP
+        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp_socket.connect((server_ip, udp_port))
+        self.udp_channel = UdpChannel()
+        self.udp_send = self.udp_socket.send
+        if udp_sim:
+            self.udp_send = LossyLink(self.udp_socket.send, **udp_sim)
+        self.outbox.append({'type': 'udp_hello', 'data': {'token': token}})
+        threading.Thread(target=self.udp_receive_loop, daemon=True).start()
+
+    def receive_loop(self):
+        # Każdą deltę trzeba złożyć (kolejne się do niej odwołują); gotowe
+        # snapshoty trafiają do pętli rysowania razem z czasem odbioru
+        reader = FrameBuffer()
+        try:
+            while self.running:
+                if not reader.recv_from(self.socket):
+                    print("Disconnected from server")
+                    break
+                for payload in reader.frames():
+                    self.handle_message(NetworkProtocol.parse_message(payload, self.protocol))
+        except Exception as e:
+            if self.running:
+                print(f"Error receiving from server: {e}")
+        self.running = False
+
+    def udp_receive_loop(self):
+        while self.running:
+            try:
+                datagram = self.udp_socket.recv(MAX_DATAGRAM_SIZE)
+                with self.udp_lock:
+                    payloads = self.udp_channel.receive(datagram)
+                for payload in payloads:
+                    self.handle_message(NetworkProtocol.parse_message(payload, self.protocol))
+            except ConnectionRefusedError:
+                continue
+            except OSError:
+                break
+            except Exception as e:
+                print(f"Bad datagram from server: {e}")
+
+    def handle_message(self, message):
+        with self.receive_lock:
+            if message['type'] in ('game_state', 'game_state_delta'):
+                if message['data']['seq'] <= self.last_snapshot_seq:
+                    return  # Spóźniony datagram UDP
+                if message['type'] == 'game_state':
+                    snapshot = message['data']
+                else:
+                    baseline = self.snapshots.get(message['data']['baseline'])
+                    if baseline is None:
+                        return
+                    snapshot = SnapshotDelta.apply(baseline, message['data'])
+                self.snapshots[snapshot['seq']] = snapshot
+                # Po UDP część seq nigdy nie przychodzi, więc przycinamy zakresem;
+                # seq rosną, więc najstarsze są na początku słownika
+                oldest = snapshot['seq'] - SNAPSHOT_HISTORY
+                while next(iter(self.snapshots)) <= oldest:
+                    del self.snapshots[next(iter(self.snapshots))]
+                self.last_snapshot_seq = snapshot['seq']
+                self.incoming.append((snapshot, time.time() * 1000))
             elif message['type'] == 'switch_weapon_ack':
                 pass
 
+    def update(self):
+        # Nie blokuje: przenosi odebrane snapshoty do bufora interpolacji,
+        # stosuje ten sprzed chwili renderowania i interpoluje pozycje
+        while self.incoming:
+            self.snapshot_buffer.add(*self.incoming.popleft())
+        sample = self.snapshot_buffer.sample(time.time() * 1000)
+        if sample is None:
+            return
+        a, b, t = sample
+        if a['seq'] != self.applied_seq:
+            self.game_state.update_from_dict(a, self.static_walls)
+            self.applied_seq = a['seq']
+        self.snapshot_buffer.interpolate(self.game_state, a, b, t)
+        self.predict_local_player()
+
+    def predict_local_player(self):
+        # Własny gracz bez opóźnienia: najnowsza pozycja od serwera plus
+        # ponownie zastosowane wejścia, których serwer jeszcze nie przetworzył
+        player = self.game_state.players.get(self.player_id)
+        record = self.snapshot_buffer.snapshots[-1]['players'].get(self.player_id)
+        if player is None or record is None:
+            return
+        if record['dead']:
+            self.prediction_base = None
+            self.prediction_error = (0, 0)
+        else:
+            wall_rects = [wall.rect for wall in self.game_state.walls]
+            collides = lambda rect: rect.collidelist(wall_rects) != -1
+            now = time.time()
+            x, y = self.replay_inputs(player, record, collides, now)
+            ex, ey = self.prediction_error
+            if self.prediction_base is not None and self.prediction_base is not record:
+                # Nowy stan z serwera: różnicę względem poprzedniego
+                # przewidywania wygaszamy przez kilka klatek zamiast skakać
+                old_x, old_y = self.replay_inputs(player, self.prediction_base, collides, now)
+                ex += old_x - x
+                ey += old_y - y
+                if ex * ex + ey * ey > 100 * 100:  # Respawn, teleport
+                    ex = ey = 0
+            self.prediction_base = record
+            player.x = x + ex
+            player.y = y + ey
+            self.prediction_error = (ex * 0.8, ey * 0.8)
+            if self.predicted_angle is not None:
+                player.angle = self.predicted_angle
+        self.acked_input_seq = record['last_input_seq']
+        while self.pending_inputs and self.pending_inputs[0][0] < record['last_input_seq']:
+            self.pending_inputs.popleft()
+
+    def replay_inputs(self, player, record, collides, now):
+        # Każde wejście działa do wysłania następnego; z ostatniego
+        # potwierdzonego odejmujemy ticki, które serwer już zastosował
+        acked = record['last_input_seq']
+        player.x = record['x']
+        player.y = record['y']
+        inputs = [entry for entry in self.pending_inputs if entry[0] >= acked]
+        for i, (seq, dx, dy, sent_at) in enumerate(inputs):
+            until = inputs[i + 1][3] if i + 1 < len(inputs) else now
+            ticks = (until - sent_at) * 60
+            if seq == acked:
+                ticks -= record['input_ticks']
+            if ticks > 0:
+                player.step(dx, dy, ticks, collides)
+        return player.x, player.y
+
     def get_camera_offset(self, player):
         cx = player.x - SCREEN_WIDTH // 2
         cy = player.y - SCREEN_HEIGHT // 2
         return (cx, cy)
 
-    def draw_minimap(self, screen, players, enemies, walls, world_view_size=2000):
+    def draw_minimap(self, screen, players, enemies, walls, world_view_size=2000, radar=()):
         minimap_size = 220  # było 200, zwiększone o 10%
         margin = 10
         minimap_surface = pygame.Surface((minimap_size, minimap_size), pygame.SRCALPHA)
@@ -200,6 +506,9 @@ class GameClient:
         for enemy in enemies:
             ex, ey = to_minimap_coords(enemy.x, enemy.y)
             pygame.draw.circle(minimap_surface, (255, 0, 0), (ex, ey), 4)
+        # Wrogowie poza ekranem (serwer wysyła dla nich same pozycje)
+        for x, y in radar:
+            pygame.draw.circle(minimap_surface, (255, 0, 0), to_minimap_coords(x, y), 4)
 
         # Draw players (blue)
         for p in players:
@@ -220,8 +529,9 @@ class GameClient:
     def draw(self):
         self.screen.fill((0, 0, 0))  # Black background
 
-        # Camera offset
+        # Camera offset (przed pierwszym snapshotem gracza jeszcze nie ma)
         camera_offset = (0, 0)
+        player = None
         if self.player_id is not None and self.player_id in self.game_state.players:
             player = self.game_state.players[self.player_id]
             camera_offset = self.get_camera_offset(player)
@@ -251,8 +561,7 @@ class GameClient:
             enemy.draw(self.screen, camera_offset)
 
         # Draw bullets
-        for bullet in self.game_state.bullets:
-            bullet.draw(self.screen, camera_offset)
+        self.game_state.bullets.draw(self.screen, camera_offset)
 
         # Draw players
         for player in self.game_state.players.values():
@@ -375,24 +684,27 @@ class GameClient:
         players = [p for p in self.game_state.players.values() if not getattr(p, 'dead', False)]
         enemies = self.game_state.enemies if hasattr(self.game_state, 'enemies') else []
         walls = self.game_state.walls if hasattr(self.game_state, 'walls') else []
-        self.draw_minimap(self.screen, players, enemies, walls, world_view_size=2000)
+        self.draw_minimap(self.screen, players, enemies, walls, world_view_size=2000, radar=self.game_state.radar)
 
         pygame.display.flip()
 
     def run(self):
         while self.running:
             self.handle_input()
+            self.flush_outbox()
             self.update()
             self.draw()
             self.clock.tick(60)
 
         self.socket.close()
+        if self.udp_channel is not None:
+            self.udp_socket.close()
         pygame.quit()
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python client.py <server_ip>")
+    if len(sys.argv) not in (2, 3) or sys.argv[2:] not in ([], ['--udp']):
+        print("Usage: python client.py <server_ip> [--udp]")
         sys.exit(1)
     
-    client = GameClient(sys.argv[1])
+    client = GameClient(sys.argv[1], transport='udp' if '--udp' in sys.argv else 'tcp')
     client.run() 
\ No newline at end of file
@@ -2,6 +2,8 @@ import math
 import pygame
 import random
 import os
+import numpy as np
+import itertools
 
 class Weapon:
     def __init__(self, name, damage, fire_rate, bullet_speed, icon_color=(255,255,0), special_type=None, max_ammo=100):
@@ -73,6 +75,8 @@ class Player:
         self.dead = False
         self.respawn_timer = 0
         self.ammo = {basic_weapon.name: basic_weapon.max_ammo}
+        self.last_input_seq = 0  # Ostatnie wejście klienta zastosowane przez serwer
+        self.input_ticks = 0  # Ile ticków serwer stosuje już to wejście
         Player.load_images(self.size)
 
     @property
@@ -94,6 +98,19 @@ class Player:
         self.x += dx * self.speed
         self.y += dy * self.speed
 
+    def step(self, dx, dy, frame_scale, collides):
+        # Ruch z kolizją ścian; wspólny dla serwera i przewidywania po stronie
+        # klienta, więc obie strony liczą dokładnie to samo
+        if dx != 0 and dy != 0:
+            dx *= 0.7071
+            dy *= 0.7071
+        new_x = self.x + dx * self.speed * 2.0 * frame_scale  # Stała, wyższa prędkość
+        new_y = self.y + dy * self.speed * 2.0 * frame_scale  # Stała, wyższa prędkość
+        rect = pygame.Rect(new_x - self.size, new_y - self.size, self.size*2, self.size*2)
+        if not collides(rect):
+            self.x = new_x
+            self.y = new_y
+
     def rotate(self, target_x, target_y):
         self.angle = math.degrees(math.atan2(target_y - self.y, target_x - self.x))
 
@@ -220,6 +237,155 @@ class Bullet:
         cx, cy = camera_offset
         pygame.draw.circle(screen, self.color, (int(self.x-cx), int(self.y-cy)), self.size)
 
+class BulletPool:
+    # Pociski trzymane jako tablice NumPy (struct-of-arrays). Ruch, limit
+    # zasięgu i testy trafień liczone są hurtowo dla wszystkich pocisków.
+    def __init__(self, capacity=256, ids=None):
+        self.count = 0
+        self.ids = ids if ids is not None else itertools.count(1)
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.vx = np.zeros(capacity)
+        self.vy = np.zeros(capacity)
+        self.start_x = np.zeros(capacity)
+        self.start_y = np.zeros(capacity)
+        self.angle = np.zeros(capacity)
+        self.max_range_sq = np.zeros(capacity)
+        self.lifetime = np.zeros(capacity)
+        self.damage = np.zeros(capacity)
+        self.owner = np.zeros(capacity, dtype=np.int32)
+        self.color = np.zeros((capacity, 3), dtype=np.int32)
+        self.is_explosive = np.zeros(capacity, dtype=bool)
+        self.explosion_radius = np.zeros(capacity)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.net_id = np.zeros(capacity, dtype=np.int64)
+
+    def _grow(self):
+        old = {name: getattr(self, name) for name in self._arrays()}
+        self._allocate(self.capacity * 2)
+        for name, array in old.items():
+            getattr(self, name)[:len(array)] = array
+
+    @staticmethod
+    def _arrays():
+        return ('x', 'y', 'vx', 'vy', 'start_x', 'start_y', 'angle', 'max_range_sq', 'lifetime',
+                'damage', 'owner', 'color', 'is_explosive', 'explosion_radius', 'alive', 'net_id')
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def spawn(self, x, y, angle, player_id, speed=10, damage=25, color=(255, 255, 0),
+              max_range=300, lifetime=60, is_explosive=False, explosion_radius=0, net_id=None):
+        if self.count == self.capacity:
+            self._grow()
+        i = self.count
+        rad = math.radians(angle)
+        self.x[i] = x
+        self.y[i] = y
+        self.vx[i] = math.cos(rad) * speed
+        self.vy[i] = math.sin(rad) * speed
+        self.start_x[i] = x
+        self.start_y[i] = y
+        self.angle[i] = angle
+        self.max_range_sq[i] = max_range * max_range
+        self.lifetime[i] = lifetime
+        self.damage[i] = damage
+        self.owner[i] = player_id
+        self.color[i] = color
+        self.is_explosive[i] = is_explosive
+        self.explosion_radius[i] = explosion_radius
+        self.alive[i] = True
+        self.net_id[i] = next(self.ids) if net_id is None else net_id
+        self.count += 1
+        return i
+
+    def add(self, bullet):
+        return self.spawn(bullet.x, bullet.y, bullet.angle, bullet.player_id, bullet.speed, bullet.damage,
+                          bullet.color, bullet.max_range, bullet.lifetime, bullet.is_explosive,
+                          bullet.explosion_radius)
+
+    def update(self, frame_scale=1.0):
+        # Odpowiednik Bullet.update dla wszystkich pocisków naraz
+        # (frame_scale = długość ticku w klatkach po 1/60 s)
+        n = self.count
+        self.x[:n] += self.vx[:n] * frame_scale
+        self.y[:n] += self.vy[:n] * frame_scale
+        self.lifetime[:n] -= frame_scale
+        dx = self.x[:n] - self.start_x[:n]
+        dy = self.y[:n] - self.start_y[:n]
+        out_of_range = dx * dx + dy * dy > self.max_range_sq[:n]
+        self.alive[:n] &= (self.lifetime[:n] > 0) & ~out_of_range
+
+    def kill(self, index):
+        self.alive[index] = False
+
+    def compact(self):
+        # Usuń martwe pociski, przesuwając żywe na początek tablic
+        n = self.count
+        keep = np.flatnonzero(self.alive[:n])
+        if len(keep) == n:
+            return
+        for name in self._arrays():
+            array = getattr(self, name)
+            array[:len(keep)] = array[keep]
+        self.count = len(keep)
+
+    def to_dicts(self):
+        n = self.count
+        return [{'id': net_id, 'x': x, 'y': y, 'angle': angle, 'player_id': owner, 'color': tuple(color)}
+                for net_id, x, y, angle, owner, color in zip(self.net_id[:n].tolist(), self.x[:n].tolist(),
+                                                             self.y[:n].tolist(), self.angle[:n].tolist(),
+                                                             self.owner[:n].tolist(), self.color[:n].tolist())]
+
+    def draw(self, screen, camera_offset=(0,0)):
+        cx, cy = camera_offset
+        n = self.count
+        for x, y, color in zip(self.x[:n].tolist(), self.y[:n].tolist(), self.color[:n].tolist()):
+            pygame.draw.circle(screen, color, (int(x-cx), int(y-cy)), 5)
+
+class EntityCollection:
+    # Encje z identyfikatorami sieciowymi. Nowa encja dostaje kolejny numer
+    # z licznika stanu gry, więc kolejność dodania = rosnące id; usuwanie po
+    # id w O(1) zamiast list.remove; indeksowanie też po id.
+    def __init__(self, ids=None):
+        self.ids = ids if ids is not None else itertools.count(1)
+        self.by_id = {}
+
+    def append(self, entity):
+        if entity.net_id is None:
+            entity.net_id = next(self.ids)
+        self.by_id[entity.net_id] = entity
+
+    def remove(self, entity):
+        if self.by_id.pop(entity.net_id, None) is None:
+            raise ValueError(f"entity {entity.net_id} not in collection")
+
+    def get(self, net_id):
+        return self.by_id.get(net_id)
+
+    def clear(self):
+        self.by_id.clear()
+
+    def __contains__(self, entity):
+        return self.by_id.get(entity.net_id) is entity
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __iter__(self):
+        # Bez kopii: pętla, która usuwa encje, iteruje po list(kolekcja)
+        return iter(self.by_id.values())
+
+    def __getitem__(self, net_id):
+        return self.by_id[net_id]
+
 class Enemy:
     images_cache = {}
 
@@ -244,6 +410,7 @@ class Enemy:
         cls.images_cache[enemy_type] = images
 
     def __init__(self, x, y, enemy_type=1):
+        self.net_id = None  # Identyfikator sieciowy, nadaje EntityCollection
         self.x = x
         self.y = y
         self.type = enemy_type
@@ -396,6 +563,7 @@ class Enemy:
 
 class Wall:
     def __init__(self, x, y, width, height, is_player_wall=False, health=100, is_indestructible=False):
+        self.net_id = None  # Identyfikator sieciowy, nadaje EntityCollection
         self.rect = pygame.Rect(x, y, width, height)
         self.is_player_wall = is_player_wall
         self.is_indestructible = is_indestructible
@@ -418,6 +586,7 @@ class Wall:
 
 class LootBox:
     def __init__(self, x, y, weapon=None):
+        self.net_id = None  # Identyfikator sieciowy, nadaje EntityCollection
         self.x = x
         self.y = y
         self.size = 15
@@ -433,6 +602,7 @@ class LootBox:
 
 class Mine:
     def __init__(self, x, y, owner_id, damage=50):
+        self.net_id = None  # Identyfikator sieciowy, nadaje EntityCollection
         self.x = x
         self.y = y
         self.size = 12
@@ -460,6 +630,7 @@ class Mine:
 
 class Pickup:
     def __init__(self, x, y, pickup_type='health', value=50):
+        self.net_id = None  # Identyfikator sieciowy, nadaje EntityCollection
         self.x = x
         self.y = y
         self.pickup_type = pickup_type
@@ -2,11 +2,77 @@ import json
 import socket
 import pickle
 import struct
-from common.game_objects import Player, Enemy, Bullet, Wall, LootBox, Mine, get_weapon_by_name, Pickup
+import itertools
+import hashlib
+import os
+import random
+import threading
+from operator import itemgetter
+from common import wire
+from common.wire import PROTOCOL_BINARY, HANDSHAKE_MAGIC
+from common.game_objects import Player, Enemy, BulletPool, EntityCollection, Wall, LootBox, Mine, get_weapon_by_name, Pickup
+
+# Ramka: długość treści (4 bajty, big-endian) + treść
+FRAME_LENGTH = struct.Struct('!I')
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+SENDMSG_MAX_BUFFERS = 1024  # IOV_MAX na Linuksie
+
+class FrameBuffer:
+    # Bufor odbiorczy ramek wypełniany przez recv_into dużymi blokami.
+    # Wszystkie pełne ramki z jednego odczytu są wydawane jako memoryview bez
+    # kopiowania; widok jest ważny tylko do następnego odczytu do bufora
+    def __init__(self, size=64 * 1024):
+        self.buffer = bytearray(size)
+        self.start = 0  # Początek nieprzetworzonych danych
+        self.end = 0  # Koniec odebranych danych
+
+    def get_buffer(self):
+        # Wolne miejsce na kolejny odczyt. Resztkę niepełnej ramki przenosimy
+        # na początek; ramka większa niż bufor dostaje nowy, większy bufor
+        # (stary może być jeszcze widoczny przez wydane memoryview)
+        pending = self.end - self.start
+        needed = len(self.buffer) // 2
+        if pending >= 4:
+            needed = max(needed, FRAME_LENGTH.size + FRAME_LENGTH.unpack_from(self.buffer, self.start)[0])
+        if len(self.buffer) - self.end < needed - pending:
+            if needed > len(self.buffer):
+                if needed > MAX_FRAME_SIZE + FRAME_LENGTH.size:
+                    raise wire.WireError(f"frame too large ({needed} bytes)")
+                buffer = bytearray(max(needed, 2 * len(self.buffer)))
+                buffer[:pending] = self.buffer[self.start:self.end]
+                self.buffer = buffer
+            elif pending:
+                self.buffer[:pending] = self.buffer[self.start:self.end]
+            self.start, self.end = 0, pending
+        return memoryview(self.buffer)[self.end:]
+
+    def buffer_updated(self, nbytes):
+        self.end += nbytes
+
+    def recv_from(self, sock):
+        # Jeden odczyt z gniazda; 0 oznacza zamknięte połączenie
+        n = sock.recv_into(self.get_buffer())
+        self.buffer_updated(n)
+        return n
+
+    def frames(self):
+        buffer = self.buffer
+        view = memoryview(buffer)
+        while self.end - self.start >= FRAME_LENGTH.size:
+            frame_end = self.start + FRAME_LENGTH.size + FRAME_LENGTH.unpack_from(buffer, self.start)[0]
+            if frame_end > self.end:
+                break
+            frame = view[self.start + FRAME_LENGTH.size:frame_end]
+            self.start = frame_end
+            yield frame
+        if self.start == self.end:
+            self.start = self.end = 0
 
 class NetworkProtocol:
     @staticmethod
-    def create_message(message_type, data):
+    def create_message(message_type, data, protocol=PROTOCOL_BINARY):
+        if protocol == PROTOCOL_BINARY:
+            return wire.encode_message(message_type, data)
         message = {
             'type': message_type,
             'data': data
@@ -14,43 +80,331 @@ class NetworkProtocol:
         return pickle.dumps(message)
 
     @staticmethod
-    def send_message(sock, message):
-        message_data = NetworkProtocol.create_message(message['type'], message['data'])
-        message_length = len(message_data)
-        sock.sendall(struct.pack('!I', message_length))
-        sock.sendall(message_data)
+    def parse_message(payload, protocol=PROTOCOL_BINARY):
+        if protocol == PROTOCOL_BINARY:
+            return wire.decode_message(payload)
+        # Tylko gdy obie strony jawnie wynegocjowały stary protokół
+        return pickle.loads(payload)
 
     @staticmethod
-    def receive_message(sock):
-        # Read message length
-        length_data = sock.recv(4)
-        if not length_data:
-            return None
-        message_length = struct.unpack('!I', length_data)[0]
-        
-        # Read message data
-        message_data = b''
-        while len(message_data) < message_length:
-            chunk = sock.recv(min(message_length - len(message_data), 4096))
-            if not chunk:
+    def encode_frame(payload):
+        return FRAME_LENGTH.pack(len(payload)) + payload
+
+    @staticmethod
+    def encode_message(message, protocol=PROTOCOL_BINARY):
+        # Gotowa ramka (długość + treść), którą można wysłać do wielu gniazd
+        message_data = NetworkProtocol.create_message(message['type'], message['data'], protocol)
+        return NetworkProtocol.encode_frame(message_data)
+
+    @staticmethod
+    def send_message(sock, message, protocol=PROTOCOL_BINARY):
+        NetworkProtocol.send_messages(sock, [message], protocol)
+
+    @staticmethod
+    def send_messages(sock, messages, protocol=PROTOCOL_BINARY):
+        # Nagłówki i treści wszystkich wiadomości jednym wywołaniem
+        buffers = []
+        for message in messages:
+            payload = NetworkProtocol.create_message(message['type'], message['data'], protocol)
+            buffers.append(FRAME_LENGTH.pack(len(payload)))
+            buffers.append(payload)
+        NetworkProtocol.send_buffers(sock, buffers)
+
+    @staticmethod
+    def send_buffers(sock, buffers):
+        # sendmsg (writev) bez sklejania buforów; po częściowym zapisie
+        # dosyłamy resztę. Bez sendmsg (Windows) sklejamy i wysyłamy sendall
+        if not hasattr(sock, 'sendmsg'):
+            sock.sendall(b''.join(buffers))
+            return
+        buffers = [memoryview(buffer) for buffer in buffers]
+        while buffers:
+            sent = sock.sendmsg(buffers[:SENDMSG_MAX_BUFFERS])
+            while sent:
+                if sent >= len(buffers[0]):
+                    sent -= len(buffers.pop(0))
+                else:
+                    buffers[0] = buffers[0][sent:]
+                    sent = 0
+            while buffers and not len(buffers[0]):
+                buffers.pop(0)
+
+    @staticmethod
+    def send_encoded(sock, frame):
+        sock.sendall(frame)
+
+    @staticmethod
+    def receive_exact(sock, size):
+        # recv może zwrócić mniej bajtów, niż prosiliśmy
+        data = bytearray(size)
+        view = memoryview(data)
+        received = 0
+        while received < size:
+            n = sock.recv_into(view[received:])
+            if not n:
                 return None
-            message_data += chunk
-        
-        return pickle.loads(message_data)
+            received += n
+        return data
+
+    @staticmethod
+    def receive_frame(sock):
+        # Pojedyncza ramka bez czytania na zapas (handshake, dołączanie);
+        # strumień snapshotów czyta FrameBuffer
+        length_data = NetworkProtocol.receive_exact(sock, 4)
+        if length_data is None:
+            return None
+        message_length = FRAME_LENGTH.unpack(length_data)[0]
+        if message_length > MAX_FRAME_SIZE:
+            raise wire.WireError(f"frame too large ({message_length} bytes)")
+        message_data = NetworkProtocol.receive_exact(sock, message_length)
+        return None if message_data is None else bytes(message_data)
+
+    @staticmethod
+    def receive_message(sock, protocol=PROTOCOL_BINARY):
+        message_data = NetworkProtocol.receive_frame(sock)
+        if message_data is None:
+            return None
+        return NetworkProtocol.parse_message(message_data, protocol)
+
+    @staticmethod
+    def client_handshake(sock, versions=(PROTOCOL_BINARY,)):
+        # Klient podaje obsługiwane wersje, serwer odpowiada wybraną (0 = brak wspólnej)
+        NetworkProtocol.send_encoded(sock, NetworkProtocol.encode_frame(HANDSHAKE_MAGIC + bytes(versions)))
+        reply = NetworkProtocol.receive_frame(sock)
+        if reply is None or len(reply) != len(HANDSHAKE_MAGIC) + 1 or not reply.startswith(HANDSHAKE_MAGIC):
+            raise ConnectionError("Invalid handshake reply from server")
+        version = reply[-1]
+        if version not in versions:
+            raise ConnectionError("Server does not support any of the protocol versions %s" % (list(versions),))
+        return version
+
+    @staticmethod
+    def negotiate(request, supported=(PROTOCOL_BINARY,)):
+        # Najwyższa wspólna wersja z oferty klienta (0 = brak wspólnej);
+        # None, jeśli ramka nie jest naszym handshake'iem
+        if request is None or not request.startswith(HANDSHAKE_MAGIC):
+            return None
+        offered = set(request[len(HANDSHAKE_MAGIC):])
+        common = [v for v in supported if v in offered]
+        return max(common) if common else 0
+
+    @staticmethod
+    def handshake_reply(version):
+        return NetworkProtocol.encode_frame(HANDSHAKE_MAGIC + bytes((version,)))
+
+# Datagram UDP: rodzaj, numer wiadomości niezawodnej (0 dla zawodnych)
+# i skumulowane potwierdzenie niezawodnych odebranych od drugiej strony
+UDP_HEADER = struct.Struct('!BII')
+UDP_UNRELIABLE = 0
+UDP_RELIABLE = 1
+UDP_ACK = 2
+# Nagłówek + treść poniżej typowego MTU (bez fragmentacji IP, w której zguba
+# jednego fragmentu gubi cały datagram); większe wiadomości idą po TCP
+MAX_DATAGRAM_SIZE = 1200
+
+class UdpChannel:
+    # Stan rozmowy z jedną drugą stroną po UDP; jeden datagram niesie jedną
+    # wiadomość. Zawodne (snapshoty, wejście) idą raz i wygrywa najnowsza.
+    # Niezawodne (join przez udp_hello, zmiana broni, restart) są numerowane,
+    # powtarzane co resend_interval do potwierdzenia i oddawane po kolei, bez
+    # duplikatów. Gniazd tu nie ma: metody zwracają datagramy do wysłania
+    def __init__(self, resend_interval=0.1, window=256):
+        self.resend_interval = resend_interval
+        self.window = window  # Ile niezawodnych może wyprzedzić brakującą
+        self.next_seq = 1
+        self.unacked = {}  # seq -> [treść, czas ostatniego wysłania]
+        self.received = 0  # Ostatnia niezawodna odebrana po kolei
+        self.early = {}  # seq -> treść, która wyprzedziła brakującą
+        self.ack_pending = False
+
+    def _pack(self, kind, seq, payload):
+        self.ack_pending = False
+        return UDP_HEADER.pack(kind, seq, self.received) + payload
+
+    @staticmethod
+    def fits(payload):
+        return UDP_HEADER.size + len(payload) <= MAX_DATAGRAM_SIZE
+
+    def unreliable(self, payload):
+        if not self.fits(payload):
+            raise wire.WireError(f"datagram too large ({len(payload)} bytes)")
+        return self._pack(UDP_UNRELIABLE, 0, payload)
+
+    def reliable(self, payload, now):
+        # Sprawdzamy przed kolejką, inaczej za duża wiadomość byłaby powtarzana bez końca
+        if not self.fits(payload):
+            raise wire.WireError(f"datagram too large ({len(payload)} bytes)")
+        seq = self.next_seq
+        self.next_seq += 1
+        self.unacked[seq] = [payload, now]
+        return self._pack(UDP_RELIABLE, seq, payload)
+
+    def receive(self, datagram):
+        # Treści wiadomości gotowe do obsłużenia, w kolejności
+        if len(datagram) < UDP_HEADER.size:
+            raise wire.WireError("truncated datagram")
+        kind, seq, ack = UDP_HEADER.unpack_from(datagram)
+        for acked in [s for s in self.unacked if s <= ack]:
+            del self.unacked[acked]
+        payload = datagram[UDP_HEADER.size:]
+        if kind == UDP_UNRELIABLE:
+            return [payload]
+        if kind != UDP_RELIABLE:
+            return []
+        self.ack_pending = True
+        if seq <= self.received or seq in self.early or seq > self.received + self.window:
+            return []
+        self.early[seq] = payload
+        ready = []
+        while self.received + 1 in self.early:
+            self.received += 1
+            ready.append(self.early.pop(self.received))
+        return ready
+
+    def poll(self, now):
+        # Datagramy bez nowej treści: powtórki niepotwierdzonych, a jeśli
+        # nic nie wychodzi, samo potwierdzenie odebranych
+        datagrams = []
+        for seq, entry in self.unacked.items():
+            if now - entry[1] >= self.resend_interval:
+                entry[1] = now
+                datagrams.append(self._pack(UDP_RELIABLE, seq, entry[0]))
+        if self.ack_pending:
+            datagrams.append(self._pack(UDP_ACK, 0, b''))
+        return datagrams
+
+class LossyLink:
+    # Symulacja złego łącza do testów na loopbacku: opakowuje funkcję wysyłającą
+    # datagram, gubi część wywołań i opóźnia resztę (rozrzut opóźnienia
+    # zmienia też kolejność). call_later jak w asyncio; domyślnie wątki Timer
+    def __init__(self, send, loss=0.0, latency=0.0, jitter=0.0, call_later=None, seed=None):
+        self.send = send
+        self.loss = loss
+        self.latency = latency
+        self.jitter = jitter
+        self.call_later = call_later or self._timer
+        self.rng = random.Random(seed)
+        self.sent = 0
+        self.dropped = 0
+
+    @staticmethod
+    def _timer(delay, callback, *args):
+        timer = threading.Timer(delay, callback, args)
+        timer.daemon = True
+        timer.start()
+
+    def __call__(self, *args):
+        if self.rng.random() < self.loss:
+            self.dropped += 1
+            return
+        self.sent += 1
+        delay = self.latency + self.rng.uniform(0, self.jitter)
+        if delay > 0:
+            self.call_later(delay, self.send, *args)
+        else:
+            self.send(*args)
+
+# Ile ostatnich snapshotów trzymają serwer i klient jako możliwe bazy delt
+SNAPSHOT_HISTORY = 32
+DELTA_LISTS = ('enemies', 'bullets', 'lootboxes', 'mines', 'pickups', 'walls')
+
+class SnapshotDelta:
+    # Różnica między dwoma snapshotami (słownikami z GameState.to_dict + 'seq').
+    # Encje porównujemy po id: wysyłamy nowe i zmienione rekordy oraz id
+    # usuniętych. Listy są posortowane rosnąco po id; encja wracająca do
+    # obszaru zainteresowania ma stare id, więc klient sortuje po scaleniu
+    # (prawie posortowana lista, więc to tanie).
+    @staticmethod
+    def make(baseline, current):
+        delta = {'seq': current['seq'], 'time': current['time'], 'baseline': baseline['seq']}
+        for name in DELTA_LISTS:
+            old = {item['id']: item for item in baseline[name]}
+            changed = []
+            for item in current[name]:
+                if old.pop(item['id'], None) != item:
+                    changed.append(item)
+            delta[name] = {'removed': list(old), 'changed': changed}
+        old_players = baseline['players']
+        delta['players'] = {pid: p for pid, p in current['players'].items() if old_players.get(pid) != p}
+        delta['removed_players'] = [pid for pid in old_players if pid not in current['players']]
+        for key in ('game_over', 'wave', 'wave_cooldown', 'scores', 'radar'):
+            delta[key] = current[key]
+        return delta
+
+    @staticmethod
+    def apply(baseline, delta):
+        state = {'seq': delta['seq'], 'time': delta['time']}
+        for name in DELTA_LISTS:
+            items = {item['id']: item for item in baseline[name]}
+            for net_id in delta[name]['removed']:
+                items.pop(net_id, None)
+            for item in delta[name]['changed']:
+                items[item['id']] = item
+            state[name] = sorted(items.values(), key=itemgetter('id'))
+        players = dict(baseline['players'])
+        for pid in delta['removed_players']:
+            players.pop(pid, None)
+        players.update(delta['players'])
+        state['players'] = players
+        for key in ('game_over', 'wave', 'wave_cooldown', 'scores', 'radar'):
+            state[key] = delta[key]
+        return state
+
+class MapCache:
+    # Statyczna geometria mapy zapisana lokalnie pod hashem swojej treści
+    # (binarne kodowanie wiadomości static_map), żeby nie pobierać jej
+    # przy każdym połączeniu
+    def __init__(self, directory):
+        self.directory = directory
+
+    @staticmethod
+    def encode(static_map):
+        return wire.encode_message('static_map', static_map)
+
+    @staticmethod
+    def content_hash(payload):
+        return hashlib.sha1(payload).hexdigest()
+
+    def path(self, map_hash):
+        return os.path.join(self.directory, map_hash + '.map')
+
+    def load(self, map_hash):
+        try:
+            with open(self.path(map_hash), 'rb') as f:
+                payload = f.read()
+        except OSError:
+            return None
+        if self.content_hash(payload) != map_hash:
+            return None
+        return wire.decode_message(payload)['data']
+
+    def store(self, static_map):
+        payload = self.encode(static_map)
+        map_hash = self.content_hash(payload)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.path(map_hash), 'wb') as f:
+                f.write(payload)
+        except OSError as e:
+            print(f"Could not cache map: {e}")
+        return map_hash
 
 class GameState:
     def __init__(self):
         self.players = {}
-        self.enemies = []
-        self.walls = []
-        self.bullets = []
-        self.lootboxes = []
-        self.mines = []
-        self.pickups = []
+        # Wspólny licznik identyfikatorów sieciowych dla wszystkich encji
+        self.ids = itertools.count(1)
+        self.enemies = EntityCollection(self.ids)
+        self.walls = EntityCollection(self.ids)
+        self.bullets = BulletPool(ids=self.ids)
+        self.lootboxes = EntityCollection(self.ids)
+        self.mines = EntityCollection(self.ids)
+        self.pickups = EntityCollection(self.ids)
         self.game_over = False
         self.wave = 1
         self.wave_cooldown = 0
         self.scores = {}
+        self.radar = []  # Pozycje wrogów poza ekranem, tylko do minimapy
 
     def to_dict(self):
         return {
@@ -64,64 +418,146 @@ class GameState:
                 'selected_weapon_index': p.selected_weapon_index,
                 'dead': getattr(p, 'dead', False),
                 'respawn_timer': getattr(p, 'respawn_timer', 0),
-                'ammo': getattr(p, 'ammo', {})
+                'ammo': dict(getattr(p, 'ammo', {})),
+                'last_input_seq': getattr(p, 'last_input_seq', 0),
+                'input_ticks': getattr(p, 'input_ticks', 0)
             } for pid, p in self.players.items()},
-            'enemies': [{'x': e.x, 'y': e.y, 'health': e.health, 'type': getattr(e, 'type', 1), 'look_angle': getattr(e, 'look_angle', 0)} for e in self.enemies],
-            'bullets': [{'x': b.x, 'y': b.y, 'angle': b.angle, 'player_id': b.player_id, 'color': getattr(b, 'color', (255,255,0))} for b in self.bullets],
-            'lootboxes': [{'x': l.x, 'y': l.y, 'weapon': l.weapon.name} for l in self.lootboxes],
-            'mines': [{'x': m.x, 'y': m.y, 'owner_id': m.owner_id, 'damage': m.damage, 'active': m.active} for m in self.mines],
-            'pickups': [{'x': p.x, 'y': p.y, 'pickup_type': p.pickup_type, 'value': p.value} for p in self.pickups],
-            'walls': [{'x': w.rect.x, 'y': w.rect.y, 'width': w.rect.width, 'height': w.rect.height, 'is_player_wall': w.is_player_wall, 'health': w.health} for w in self.walls],
+            'enemies': [{'id': e.net_id, 'x': e.x, 'y': e.y, 'health': e.health, 'type': getattr(e, 'type', 1), 'look_angle': getattr(e, 'look_angle', 0)} for e in self.enemies],
+            'bullets': self.bullets.to_dicts(),
+            'lootboxes': [{'id': l.net_id, 'x': l.x, 'y': l.y, 'weapon': l.weapon.name} for l in self.lootboxes],
+            'mines': [{'id': m.net_id, 'x': m.x, 'y': m.y, 'owner_id': m.owner_id, 'damage': m.damage, 'active': m.active} for m in self.mines],
+            'pickups': [{'id': p.net_id, 'x': p.x, 'y': p.y, 'pickup_type': p.pickup_type, 'value': p.value} for p in self.pickups],
+            # Niezniszczalne ściany to statyczna mapa, wysyłana raz przy dołączeniu
+            'walls': [self.wall_to_dict(w) for w in self.walls if not w.is_indestructible],
             'game_over': self.game_over,
             'wave': self.wave,
             'wave_cooldown': self.wave_cooldown,
-            'scores': self.scores
+            'scores': dict(self.scores),
+            'radar': [{'x': x, 'y': y} for x, y in self.radar]
         }
 
+    @staticmethod
+    def wall_to_dict(w):
+        return {'id': w.net_id, 'x': w.rect.x, 'y': w.rect.y, 'width': w.rect.width, 'height': w.rect.height, 'is_player_wall': w.is_player_wall, 'health': w.health}
+
+    @staticmethod
+    def wall_from_dict(w_data):
+        wall = Wall(w_data['x'], w_data['y'], w_data['width'], w_data['height'], w_data.get('is_player_wall', False), w_data.get('health', 100))
+        wall.net_id = w_data['id']
+        return wall
+
     @classmethod
-    def from_dict(cls, data):
-        from common.game_objects import Player, Enemy, Bullet, LootBox, Mine, get_weapon_by_name, Wall, Pickup
+    def from_dict(cls, data, static_walls=()):
         state = cls()
+        state.update_from_dict(data, static_walls)
+        return state
 
+    def update_from_dict(self, data, static_walls=()):
+        # Aktualizacja w miejscu: obiekty encji żyją między snapshotami (po id),
+        # nowe tworzymy tylko dla nowych id, usunięte wyrzucamy
+        for pid in [pid for pid in self.players if pid not in data['players']]:
+            del self.players[pid]
         for pid, p_data in data['players'].items():
-            player = Player(p_data['x'], p_data['y'], pid)
+            player = self.players.get(pid)
+            if player is None:
+                player = Player(p_data['x'], p_data['y'], pid)
+                self.players[pid] = player
+            player.x = p_data['x']
+            player.y = p_data['y']
             player.angle = p_data['angle']
             player.health = p_data['health']
             player.armor = p_data.get('armor', 0)
-            player.weapons = [get_weapon_by_name(name) for name in p_data.get('weapons', ['Pistol'])]
+            weapons = p_data.get('weapons', ['Pistol'])
+            if [w.name for w in player.weapons] != weapons:
+                player.weapons = [get_weapon_by_name(name) for name in weapons]
             player.selected_weapon_index = p_data.get('selected_weapon_index', 0)
             player.dead = p_data.get('dead', False)
             player.respawn_timer = p_data.get('respawn_timer', 0)
-            player.ammo = {}
-            for weapon_name, ammo_count in p_data.get('ammo', {}).items():
-                player.ammo[weapon_name] = ammo_count
-            state.players[pid] = player
-        for e_data in data['enemies']:
-            enemy = Enemy(e_data['x'], e_data['y'], e_data.get('type', 1))
-            enemy.health = e_data['health']
-            enemy.look_angle = e_data.get('look_angle', 0)
-            state.enemies.append(enemy)
+            player.last_input_seq = p_data.get('last_input_seq', 0)
+            player.input_ticks = p_data.get('input_ticks', 0)
+            ammo = p_data.get('ammo', {})
+            if player.ammo != ammo:
+                player.ammo = dict(ammo)
+
+        self._reconcile(self.enemies, data['enemies'], self._new_enemy, self._update_enemy)
+        self.bullets.clear()
         for b_data in data['bullets']:
-            bullet = Bullet(b_data['x'], b_data['y'], b_data['angle'], b_data['player_id'])
-            if 'color' in b_data:
-                bullet.color = b_data['color']
-            state.bullets.append(bullet)
-        for l_data in data.get('lootboxes', []):
-            weapon = get_weapon_by_name(l_data['weapon'])
-            lootbox = LootBox(l_data['x'], l_data['y'], weapon)
-            state.lootboxes.append(lootbox)
-        for m_data in data.get('mines', []):
-            mine = Mine(m_data['x'], m_data['y'], m_data['owner_id'], m_data['damage'])
-            mine.active = m_data.get('active', True)
-            state.mines.append(mine)
-        for w_data in data.get('walls', []):
-            wall = Wall(w_data['x'], w_data['y'], w_data['width'], w_data['height'], w_data.get('is_player_wall', False), w_data.get('health', 100))
-            state.walls.append(wall)
-        for p_data in data.get('pickups', []):
-            pickup = Pickup(p_data['x'], p_data['y'], p_data['pickup_type'], p_data['value'])
-            state.pickups.append(pickup)
-        state.game_over = data.get('game_over', False)
-        state.wave = data.get('wave', 1)
-        state.wave_cooldown = data.get('wave_cooldown', 0)
-        state.scores = data.get('scores', {})
-        return state 
\ No newline at end of file
+            self.bullets.spawn(b_data['x'], b_data['y'], b_data['angle'], b_data['player_id'], color=b_data.get('color', (255, 255, 0)), net_id=b_data['id'])
+        self._reconcile(self.lootboxes, data.get('lootboxes', []), self._new_lootbox, self._update_position)
+        self._reconcile(self.mines, data.get('mines', []), self._new_mine, self._update_mine)
+        for wall in static_walls:
+            if wall.net_id not in self.walls.by_id:
+                self.walls.append(wall)
+        self._reconcile(self.walls, data.get('walls', []), self.wall_from_dict, self._update_wall,
+                        keep=[wall.net_id for wall in static_walls])
+        self._reconcile(self.pickups, data.get('pickups', []), self._new_pickup, self._update_pickup)
+        self.game_over = data.get('game_over', False)
+        self.wave = data.get('wave', 1)
+        self.wave_cooldown = data.get('wave_cooldown', 0)
+        self.scores = data.get('scores', {})
+        self.radar = [(r['x'], r['y']) for r in data.get('radar', [])]
+
+    @staticmethod
+    def _reconcile(collection, records, create, update, keep=()):
+        seen = set(keep)
+        for record in records:
+            entity = collection.get(record['id'])
+            if entity is None:
+                entity = create(record)
+                entity.net_id = record['id']
+                collection.append(entity)
+            else:
+                update(entity, record)
+            seen.add(record['id'])
+        if len(collection) != len(seen):
+            for entity in list(collection):
+                if entity.net_id not in seen:
+                    collection.remove(entity)
+
+    @staticmethod
+    def _new_enemy(e_data):
+        enemy = Enemy(e_data['x'], e_data['y'], e_data.get('type', 1))
+        GameState._update_enemy(enemy, e_data)
+        return enemy
+
+    @staticmethod
+    def _update_enemy(enemy, e_data):
+        enemy.x = e_data['x']
+        enemy.y = e_data['y']
+        enemy.health = e_data['health']
+        enemy.look_angle = e_data.get('look_angle', 0)
+
+    @staticmethod
+    def _new_lootbox(l_data):
+        return LootBox(l_data['x'], l_data['y'], get_weapon_by_name(l_data['weapon']))
+
+    @staticmethod
+    def _update_position(entity, data):
+        entity.x = data['x']
+        entity.y = data['y']
+
+    @staticmethod
+    def _new_mine(m_data):
+        mine = Mine(m_data['x'], m_data['y'], m_data['owner_id'], m_data['damage'])
+        mine.active = m_data.get('active', True)
+        return mine
+
+    @staticmethod
+    def _update_mine(mine, m_data):
+        mine.x = m_data['x']
+        mine.y = m_data['y']
+        mine.active = m_data.get('active', True)
+
+    @staticmethod
+    def _update_wall(wall, w_data):
+        wall.health = w_data.get('health', 100)
+
+    @staticmethod
+    def _new_pickup(p_data):
+        return Pickup(p_data['x'], p_data['y'], p_data['pickup_type'], p_data['value'])
+
+    @staticmethod
+    def _update_pickup(pickup, p_data):
+        pickup.x = p_data['x']
+        pickup.y = p_data['y']
+        pickup.value = p_data['value']
@@ -0,0 +1,342 @@
+import re
+import struct
+from operator import itemgetter
+from common.game_objects import WEAPON_LIST
+
+# Binarny format wiadomości: 1 bajt typu + rekord o stałym układzie.
+# Pola skalarne są pakowane przez struct (little-endian), liczności list
+# i map jako varint; na łączu nie ma nazw pól.
+
+PROTOCOL_PICKLE = 1
+PROTOCOL_BINARY = 2
+HANDSHAKE_MAGIC = b'BXHD'
+
+class WireError(ValueError):
+    pass
+
+def write_varint(buf, value):
+    while value >= 0x80:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+def read_varint(data, offset):
+    result = 0
+    shift = 0
+    while True:
+        if offset >= len(data):
+            raise WireError("truncated varint")
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, offset
+        shift += 7
+
+class Varint:
+    def encode(self, buf, value):
+        write_varint(buf, value)
+
+    def decode(self, data, offset):
+        return read_varint(data, offset)
+
+class SVarint:
+    # Zigzag, żeby małe ujemne liczby (np. id -1) zajmowały jeden bajt
+    def encode(self, buf, value):
+        write_varint(buf, (value << 1) ^ (value >> 63))
+
+    def decode(self, data, offset):
+        value, offset = read_varint(data, offset)
+        return (value >> 1) ^ -(value & 1), offset
+
+class String:
+    def encode(self, buf, value):
+        raw = value.encode('utf-8')
+        write_varint(buf, len(raw))
+        buf += raw
+
+    def decode(self, data, offset):
+        length, offset = read_varint(data, offset)
+        end = offset + length
+        if end > len(data):
+            raise WireError("truncated string")
+        return bytes(data[offset:end]).decode('utf-8'), end
+
+class WeaponName:
+    # Broń jako indeks na WEAPON_LIST (wspólnej dla klienta i serwera)
+    names = [w.name for w in WEAPON_LIST]
+    index = {name: i for i, name in enumerate(names)}
+
+    def encode(self, buf, value):
+        buf.append(self.index[value])
+
+    def decode(self, data, offset):
+        if offset >= len(data):
+            raise WireError("truncated weapon")
+        i = data[offset]
+        if i >= len(self.names):
+            raise WireError(f"unknown weapon index {i}")
+        return self.names[i], offset + 1
+
+class Ammo:
+    # Liczba naboi; nieskończona amunicja (Pistol) jako -1
+    def encode(self, buf, value):
+        SVarint().encode(buf, -1 if value == float('inf') else int(value))
+
+    def decode(self, data, offset):
+        value, offset = SVarint().decode(data, offset)
+        return (float('inf') if value == -1 else value), offset
+
+class ListOf:
+    def __init__(self, kind):
+        self.kind = kind
+
+    def encode(self, buf, values):
+        write_varint(buf, len(values))
+        if isinstance(self.kind, Record) and self.kind.fixed:
+            self.kind.encode_many(buf, values)
+        else:
+            for value in values:
+                self.kind.encode(buf, value)
+
+    def decode(self, data, offset):
+        count, offset = read_varint(data, offset)
+        if isinstance(self.kind, Record) and self.kind.fixed:
+            return self.kind.decode_many(data, offset, count)
+        values = []
+        for _ in range(count):
+            value, offset = self.kind.decode(data, offset)
+            values.append(value)
+        return values, offset
+
+class MapOf:
+    def __init__(self, key_kind, value_kind):
+        self.key_kind = key_kind
+        self.value_kind = value_kind
+
+    def encode(self, buf, mapping):
+        write_varint(buf, len(mapping))
+        for key, value in mapping.items():
+            self.key_kind.encode(buf, key)
+            self.value_kind.encode(buf, value)
+
+    def decode(self, data, offset):
+        count, offset = read_varint(data, offset)
+        mapping = {}
+        for _ in range(count):
+            key, offset = self.key_kind.decode(data, offset)
+            mapping[key], offset = self.value_kind.decode(data, offset)
+        return mapping, offset
+
+_SCALAR = re.compile(r'^(\d*)([?bBhHiIfd])$')
+
+class Encoded(bytes):
+    # Rekord zakodowany zawczasu (Record.preencode), np. gracz wspólny dla
+    # wiadomości do wszystkich klientów; Record.encode dokleja go bez zmian
+    pass
+
+class Record:
+    # Słownik o znanych polach. Pola skalarne to kody struct ('f', 'H', '3B'
+    # dla krotki itd.); kolejne skalary są łączone w jeden struct.Struct.
+    def __init__(self, *fields):
+        self.fields = fields
+        self.segments = []
+        fmt = ''
+        group = []
+        for name, kind in fields:
+            if isinstance(kind, str):
+                match = _SCALAR.match(kind)
+                if not match:
+                    raise ValueError(f"bad scalar format {kind!r} for {name}")
+                fmt += kind
+                group.append((name, int(match.group(1) or 1)))
+            else:
+                if group:
+                    self.segments.append(self._compile(fmt, group))
+                    fmt, group = '', []
+                self.segments.append((kind, name))
+        if group:
+            self.segments.append(self._compile(fmt, group))
+        self.fixed = len(self.segments) == 1 and isinstance(self.segments[0][0], struct.Struct)
+
+    @staticmethod
+    def _compile(fmt, group):
+        # Plan grupy skalarów: same pola jednoelementowe idą przez itemgetter
+        # i zip; jedna krotka na końcu (np. kolor) jest doklejana osobno
+        tail = None
+        if group[-1][1] > 1 and all(count == 1 for _, count in group[:-1]):
+            tail = group[-1][0]
+            group = group[:-1]
+        elif any(count > 1 for _, count in group):
+            raise ValueError("only the last field of a scalar group may be a tuple")
+        names = tuple(name for name, _ in group)
+        if len(names) == 1:
+            getter = (lambda name: lambda value: (value[name],))(names[0])
+        elif names:
+            getter = itemgetter(*names)
+        else:
+            getter = lambda value: ()
+        return struct.Struct('<' + fmt), (names, getter, tail, len(names))
+
+    @staticmethod
+    def _flatten(spec, value):
+        names, getter, tail, n = spec
+        if tail is None:
+            return getter(value)
+        return (*getter(value), *value[tail])
+
+    @staticmethod
+    def _unflatten(spec, values):
+        names, getter, tail, n = spec
+        out = dict(zip(names, values))
+        if tail is not None:
+            out[tail] = values[n:]
+        return out
+
+    def encode(self, buf, value):
+        if type(value) is Encoded:
+            buf += value
+            return
+        for kind, spec in self.segments:
+            if isinstance(kind, struct.Struct):
+                buf += kind.pack(*self._flatten(spec, value))
+            else:
+                kind.encode(buf, value[spec])
+
+    def preencode(self, value):
+        buf = bytearray()
+        self.encode(buf, value)
+        return Encoded(buf)
+
+    def decode(self, data, offset):
+        out = {}
+        for kind, spec in self.segments:
+            if isinstance(kind, struct.Struct):
+                if offset + kind.size > len(data):
+                    raise WireError("truncated record")
+                out.update(self._unflatten(spec, kind.unpack_from(data, offset)))
+                offset += kind.size
+            else:
+                out[spec], offset = kind.decode(data, offset)
+        return out, offset
+
+    def encode_many(self, buf, values):
+        packer, spec = self.segments[0]
+        pack = packer.pack
+        names, getter, tail, n = spec
+        if tail is None:
+            buf += b''.join([pack(*getter(value)) for value in values])
+        else:
+            buf += b''.join([pack(*getter(value), *value[tail]) for value in values])
+
+    def decode_many(self, data, offset, count):
+        unpacker, spec = self.segments[0]
+        end = offset + unpacker.size * count
+        if end > len(data):
+            raise WireError("truncated list")
+        rows = unpacker.iter_unpack(data[offset:end])
+        names, getter, tail, n = spec
+        if tail is None:
+            return [dict(zip(names, values)) for values in rows], end
+        out = []
+        for values in rows:
+            item = dict(zip(names, values))
+            item[tail] = values[n:]
+            out.append(item)
+        return out, end
+
+# --- Schematy wiadomości ---
+
+PLAYER = Record(
+    ('x', 'f'), ('y', 'f'), ('angle', 'f'), ('health', 'f'), ('armor', 'f'),
+    ('selected_weapon_index', 'B'), ('dead', '?'), ('respawn_timer', 'f'), ('last_input_seq', 'I'), ('input_ticks', 'H'),
+    ('weapons', ListOf(WeaponName())),
+    ('ammo', MapOf(WeaponName(), Ammo())),
+)
+ENEMY = Record(('id', 'I'), ('x', 'f'), ('y', 'f'), ('health', 'f'), ('type', 'B'), ('look_angle', 'f'))
+BULLET = Record(('id', 'I'), ('x', 'f'), ('y', 'f'), ('angle', 'f'), ('player_id', 'h'), ('color', '3B'))
+LOOTBOX = Record(('id', 'I'), ('x', 'f'), ('y', 'f'), ('weapon', WeaponName()))
+MINE = Record(('id', 'I'), ('x', 'f'), ('y', 'f'), ('owner_id', 'h'), ('damage', 'f'), ('active', '?'))
+PICKUP = Record(('id', 'I'), ('x', 'f'), ('y', 'f'), ('pickup_type', String()), ('value', 'f'))
+RADAR = Record(('x', 'h'), ('y', 'h'))
+WALL = Record(('id', 'I'), ('x', 'i'), ('y', 'i'), ('width', 'i'), ('height', 'i'), ('is_player_wall', '?'), ('health', 'f'))
+
+GAME_STATE = Record(
+    ('seq', 'I'), ('time', 'd'),
+    ('players', MapOf(SVarint(), PLAYER)),
+    ('enemies', ListOf(ENEMY)),
+    ('bullets', ListOf(BULLET)),
+    ('lootboxes', ListOf(LOOTBOX)),
+    ('mines', ListOf(MINE)),
+    ('pickups', ListOf(PICKUP)),
+    ('walls', ListOf(WALL)),
+    ('game_over', '?'), ('wave', 'H'), ('wave_cooldown', 'f'),
+    ('scores', MapOf(SVarint(), SVarint())),
+    ('radar', ListOf(RADAR)),
+)
+
+def list_delta(record):
+    # id usuniętych encji i pełne rekordy nowych lub zmienionych
+    return Record(('removed', ListOf(Varint())), ('changed', ListOf(record)))
+
+GAME_STATE_DELTA = Record(
+    ('seq', 'I'), ('time', 'd'), ('baseline', 'I'),
+    ('players', MapOf(SVarint(), PLAYER)),
+    ('removed_players', ListOf(SVarint())),
+    ('enemies', list_delta(ENEMY)),
+    ('bullets', list_delta(BULLET)),
+    ('lootboxes', list_delta(LOOTBOX)),
+    ('mines', list_delta(MINE)),
+    ('pickups', list_delta(PICKUP)),
+    ('walls', list_delta(WALL)),
+    ('game_over', '?'), ('wave', 'H'), ('wave_cooldown', 'f'),
+    ('scores', MapOf(SVarint(), SVarint())),
+    ('radar', ListOf(RADAR)),
+)
+# seq: kolejny numer wejścia (serwer odsyła ostatni zastosowany w last_input_seq)
+# ack: numer ostatniego snapshotu zastosowanego przez klienta (0 = brak)
+PLAYER_INPUT = Record(('seq', 'I'), ('dx', 'f'), ('dy', 'f'), ('angle', 'f'), ('shoot', '?'), ('mouse_x', 'f'), ('mouse_y', 'f'), ('ack', 'I'))
+# Po UDP: ostatnie niepotwierdzone wejścia w jednym datagramie
+PLAYER_INPUTS = Record(('inputs', ListOf(PLAYER_INPUT)))
+WEAPON_INDEX = Record(('selected_weapon_index', 'B'))
+# udp_port = 0: serwer nie oferuje UDP; token wiąże adres UDP klienta z graczem
+JOIN = Record(('player_id', 'h'), ('udp_port', 'H'), ('udp_token', 'I'), ('map_hash', String()))
+JOIN_ACK = Record(('have_map', '?'))
+STATIC_MAP = Record(('walls', ListOf(WALL)))
+UDP_HELLO = Record(('token', 'I'))
+EMPTY = Record()
+
+# Typ wiadomości -> (identyfikator na łączu, schemat)
+MESSAGE_TYPES = {
+    'game_state': (1, GAME_STATE),
+    'player_input': (2, PLAYER_INPUT),
+    'switch_weapon': (3, WEAPON_INDEX),
+    'switch_weapon_ack': (4, WEAPON_INDEX),
+    'restart_game': (5, EMPTY),
+    'game_state_delta': (6, GAME_STATE_DELTA),
+    'join': (7, JOIN),
+    'join_ack': (8, JOIN_ACK),
+    'static_map': (9, STATIC_MAP),
+    'udp_hello': (10, UDP_HELLO),
+    'player_inputs': (11, PLAYER_INPUTS),
+}
+_BY_ID = {type_id: (name, schema) for name, (type_id, schema) in MESSAGE_TYPES.items()}
+
+def encode_message(message_type, data):
+    try:
+        type_id, schema = MESSAGE_TYPES[message_type]
+    except KeyError:
+        raise WireError(f"unknown message type {message_type!r}")
+    buf = bytearray((type_id,))
+    schema.encode(buf, data)
+    return bytes(buf)
+
+def decode_message(payload):
+    if not payload:
+        raise WireError("empty message")
+    try:
+        message_type, schema = _BY_ID[payload[0]]
+    except KeyError:
+        raise WireError(f"unknown message id {payload[0]}")
+    data, _ = schema.decode(payload, 1)
+    return {'type': message_type, 'data': data}
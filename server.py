@@ -1,36 +1,593 @@
 import socket
-import threading
+import asyncio
+import secrets
 import time
 import random
 import math
 import pygame
 import heapq
+import numpy as np
+from collections import deque
 from common.game_objects import Player, Enemy, Bullet, Wall, LootBox, get_random_weapon, Mine, Pickup, get_weapon_by_name
-from common.network import NetworkProtocol, GameState
+from common.network import NetworkProtocol, FrameBuffer, UdpChannel, LossyLink, GameState, SnapshotDelta, MapCache, SNAPSHOT_HISTORY
+from common import wire
+from common.wire import PROTOCOL_BINARY, PROTOCOL_PICKLE
+
+class NavGrid:
+    # Siatka nawigacyjna trzymana przez serwer i łatana przy zmianie ścian.
+    # Komórka przechowuje liczbę ścian, które ją pokrywają (0 = wolna), dzięki
+    # czemu usunięcie jednej z nakładających się ścian nie odblokowuje komórki.
+    def __init__(self, width=4000, height=3000, cell_size=40):
+        self.cell_size = cell_size
+        self.grid_w = width // cell_size
+        self.grid_h = height // cell_size
+        self.grid = [[0] * self.grid_h for _ in range(self.grid_w)]
+        self.version = 0  # Zwiększane przy każdej zmianie układu ścian
+
+    def _mark(self, rect, delta):
+        cs = self.cell_size
+        x0 = max(0, rect.left // cs)
+        x1 = min(self.grid_w - 1, (rect.right - 1) // cs)
+        y0 = max(0, rect.top // cs)
+        y1 = min(self.grid_h - 1, (rect.bottom - 1) // cs)
+        for gx in range(x0, x1 + 1):
+            column = self.grid[gx]
+            for gy in range(y0, y1 + 1):
+                column[gy] += delta
+        self.version += 1
+
+    def add_wall(self, wall):
+        self._mark(wall.rect, 1)
+
+    def remove_wall(self, wall):
+        self._mark(wall.rect, -1)
+
+    def cell_of(self, x, y):
+        return int(x) // self.cell_size, int(y) // self.cell_size
+
+    def cell_center(self, gx, gy):
+        return gx * self.cell_size + self.cell_size // 2, gy * self.cell_size + self.cell_size // 2
+
+def segment_hits_rect(x1, y1, x2, y2, rect):
+    # Test odcinka z prostokątem metodą Lianga-Barsky'ego (dokładny, na floatach)
+    t0, t1 = 0.0, 1.0
+    dx = x2 - x1
+    dy = y2 - y1
+    for p, q in ((-dx, x1 - rect.left), (dx, rect.right - x1), (-dy, y1 - rect.top), (dy, rect.bottom - y1)):
+        if p == 0:
+            if q < 0:
+                return False
+        else:
+            t = q / p
+            if p < 0:
+                if t > t1:
+                    return False
+                t0 = max(t0, t)
+            else:
+                if t < t0:
+                    return False
+                t1 = min(t1, t)
+    return True
+
+class SpatialHash:
+    # Równomierna siatka kubełków z prostokątami ścian; aktualizowana przy
+    # dodaniu/usunięciu ściany, więc zapytania nie przeglądają całej listy
+    def __init__(self, cell_size=200):
+        self.cell_size = cell_size
+        self.buckets = {}
+
+    def _keys(self, rect):
+        cs = self.cell_size
+        for cx in range(rect.left // cs, (rect.right - 1) // cs + 1):
+            for cy in range(rect.top // cs, (rect.bottom - 1) // cs + 1):
+                yield cx, cy
+
+    def insert(self, wall):
+        for key in self._keys(wall.rect):
+            self.buckets.setdefault(key, []).append(wall)
+
+    def remove(self, wall):
+        for key in self._keys(wall.rect):
+            bucket = self.buckets.get(key)
+            if bucket and wall in bucket:
+                bucket.remove(wall)
+                if not bucket:
+                    del self.buckets[key]
+
+    def query_rect(self, rect):
+        # Ściany nachodzące na prostokąt (bez duplikatów)
+        found = {}
+        for key in self._keys(rect):
+            for wall in self.buckets.get(key, ()):
+                if id(wall) not in found and wall.rect.colliderect(rect):
+                    found[id(wall)] = wall
+        return list(found.values())
+
+    def raycast(self, x1, y1, x2, y2):
+        # Przejście po kubełkach wzdłuż odcinka (DDA Amanatidesa-Woo); zwraca
+        # pierwszą znalezioną ścianę przecinającą odcinek albo None
+        cs = self.cell_size
+        cx, cy = math.floor(x1 / cs), math.floor(y1 / cs)
+        end_cx, end_cy = math.floor(x2 / cs), math.floor(y2 / cs)
+        dx = x2 - x1
+        dy = y2 - y1
+        step_x = 1 if dx > 0 else -1
+        step_y = 1 if dy > 0 else -1
+        t_delta_x = cs / abs(dx) if dx else float('inf')
+        t_delta_y = cs / abs(dy) if dy else float('inf')
+        if dx > 0:
+            t_max_x = ((cx + 1) * cs - x1) / dx
+        elif dx < 0:
+            t_max_x = (cx * cs - x1) / dx
+        else:
+            t_max_x = float('inf')
+        if dy > 0:
+            t_max_y = ((cy + 1) * cs - y1) / dy
+        elif dy < 0:
+            t_max_y = (cy * cs - y1) / dy
+        else:
+            t_max_y = float('inf')
+        tested = set()
+        while True:
+            for wall in self.buckets.get((cx, cy), ()):
+                if id(wall) not in tested:
+                    tested.add(id(wall))
+                    if segment_hits_rect(x1, y1, x2, y2, wall.rect):
+                        return wall
+            if (cx, cy) == (end_cx, end_cy) or min(t_max_x, t_max_y) > 1:
+                return None
+            if t_max_x < t_max_y:
+                cx += step_x
+                t_max_x += t_delta_x
+            else:
+                cy += step_y
+                t_max_y += t_delta_y
+
+class EntityGrid:
+    # Kubełki z jednostkami (wrogowie, gracze) przebudowywane co tick. Jednostka
+    # trafia do każdego kubełka, na który zachodzi jej kwadrat (x±size, y±size),
+    # więc trafienie punktem wymaga sprawdzenia tylko jednego kubełka.
+    def __init__(self, cell_size=100):
+        self.cell_size = cell_size
+        self.buckets = {}
+
+    def _keys(self, x, y, radius):
+        cs = self.cell_size
+        for cx in range(int(math.floor((x - radius) / cs)), int(math.floor((x + radius) / cs)) + 1):
+            for cy in range(int(math.floor((y - radius) / cs)), int(math.floor((y + radius) / cs)) + 1):
+                yield cx, cy
+
+    def rebuild(self, entities):
+        self.buckets = {}
+        for entity in entities:
+            for key in self._keys(entity.x, entity.y, entity.size):
+                self.buckets.setdefault(key, []).append(entity)
+
+    def remove(self, entity):
+        for key in self._keys(entity.x, entity.y, entity.size):
+            bucket = self.buckets.get(key)
+            if bucket and entity in bucket:
+                bucket.remove(entity)
+
+    def query_radius(self, x, y, radius):
+        # Kandydaci, których kwadrat może leżeć w promieniu; dokładny test robi wywołujący
+        found = {}
+        for key in self._keys(x, y, radius):
+            for entity in self.buckets.get(key, ()):
+                found[id(entity)] = entity
+        return list(found.values())
+
+class SnapshotGrid:
+    # Rekordy snapshotu (słowniki) rozłożone do kubełków raz na rozgłoszenie;
+    # widok klienta odczytuje tylko kubełki ze swojego obszaru zainteresowania
+    # zamiast przeglądać wszystkie encje
+    def __init__(self, cell_size=250):
+        self.cell_size = cell_size
+        self.buckets = {}
+
+    def _keys(self, left, top, right, bottom):
+        cs = self.cell_size
+        for cx in range(math.floor(left / cs), math.floor(right / cs) + 1):
+            for cy in range(math.floor(top / cs), math.floor(bottom / cs) + 1):
+                yield cx, cy
+
+    def insert(self, record, left, top, right, bottom):
+        for key in self._keys(left, top, right, bottom):
+            self.buckets.setdefault(key, []).append(record)
+
+    def query(self, left, top, right, bottom):
+        # Kandydaci bez duplikatów, rosnąco po id jak listy snapshotu;
+        # dokładny test robi wywołujący
+        found = {}
+        for key in self._keys(left, top, right, bottom):
+            for record in self.buckets.get(key, ()):
+                found[record['id']] = record
+        return [found[net_id] for net_id in sorted(found)]
+
+class FlowField:
+    # Wspólne pole odległości do najbliższego żywego gracza (BFS z wielu źródeł
+    # po siatce nawigacyjnej). Przeciwnicy odczytują z niego następny krok w O(1).
+    UNREACHED = -1
+
+    def __init__(self, nav_grid):
+        self.nav = nav_grid
+        self.dist = [self.UNREACHED] * (nav_grid.grid_w * nav_grid.grid_h)
+        self.nav_version = -1
+        self.sources = ()
+
+    def rebuild(self, positions):
+        nav = self.nav
+        grid, grid_w, grid_h = nav.grid, nav.grid_w, nav.grid_h
+        dist = [self.UNREACHED] * (grid_w * grid_h)
+        queue = deque()
+        sources = set()
+        for x, y in positions:
+            gx, gy = nav.cell_of(x, y)
+            if 0 <= gx < grid_w and 0 <= gy < grid_h and (gx, gy) not in sources:
+                sources.add((gx, gy))
+                dist[gx * grid_h + gy] = 0
+                queue.append((gx, gy))
+        unreached = self.UNREACHED
+        while queue:
+            gx, gy = queue.popleft()
+            d = dist[gx * grid_h + gy] + 1
+            if gx > 0 and grid[gx-1][gy] == 0 and dist[(gx-1) * grid_h + gy] == unreached:
+                dist[(gx-1) * grid_h + gy] = d
+                queue.append((gx-1, gy))
+            if gx < grid_w - 1 and grid[gx+1][gy] == 0 and dist[(gx+1) * grid_h + gy] == unreached:
+                dist[(gx+1) * grid_h + gy] = d
+                queue.append((gx+1, gy))
+            column = grid[gx]
+            if gy > 0 and column[gy-1] == 0 and dist[gx * grid_h + gy - 1] == unreached:
+                dist[gx * grid_h + gy - 1] = d
+                queue.append((gx, gy-1))
+            if gy < grid_h - 1 and column[gy+1] == 0 and dist[gx * grid_h + gy + 1] == unreached:
+                dist[gx * grid_h + gy + 1] = d
+                queue.append((gx, gy+1))
+        self.dist = dist
+        self.nav_version = nav.version
+        self.sources = frozenset(sources)
+
+    def distance(self, gx, gy):
+        if 0 <= gx < self.nav.grid_w and 0 <= gy < self.nav.grid_h:
+            return self.dist[gx * self.nav.grid_h + gy]
+        return self.UNREACHED
+
+    def next_step(self, x, y):
+        # Zwraca środek sąsiedniej komórki bliższej graczowi albo None, gdy
+        # przeciwnik jest już w komórce gracza lub nie ma do niego drogi
+        nav = self.nav
+        gx, gy = nav.cell_of(x, y)
+        current = self.distance(gx, gy)
+        if current == 0:
+            return None
+        best = None
+        best_dist = current if current != self.UNREACHED else float('inf')
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                if dx == 0 and dy == 0:
+                    continue
+                d = self.distance(gx + dx, gy + dy)
+                if d == self.UNREACHED or d >= best_dist:
+                    continue
+                # Ruch po skosie tylko gdy nie ścinamy rogu ściany
+                if dx and dy and (self.distance(gx + dx, gy) == self.UNREACHED or self.distance(gx, gy + dy) == self.UNREACHED):
+                    continue
+                best = (gx + dx, gy + dy)
+                best_dist = d
+        if best is None:
+            return None
+        return nav.cell_center(*best)
+
+class EnemyPath:
+    # Zapamiętana ścieżka A* jednego wroga (komórki siatki). cells = None to
+    # nieudane wyszukiwanie, ponawiane dopiero przy zmianie celu lub ścian
+    # albo od ticku retry_at
+    def __init__(self, cells, goal, nav_version, retry_at):
+        self.cells = cells
+        self.index = 0
+        self.goal = goal
+        self.nav_version = nav_version
+        self.retry_at = retry_at
+
+class FixedTimestep:
+    # Harmonogram ticków o stałym kroku: akumulator czasu, limit nadrabiania
+    # i liczniki ticków, które nie zmieściły się w budżecie
+    def __init__(self, tick_rate=60, max_catchup_ticks=5, report_interval=10.0):
+        self.tick_rate = tick_rate
+        self.dt = 1.0 / tick_rate
+        self.max_catchup_ticks = max_catchup_ticks
+        self.report_interval = report_interval
+        self.reset(time.monotonic())
+
+    def reset(self, now):
+        self.last_time = now
+        self.accumulator = 0.0
+        self.ticks = 0
+        self.overrun_ticks = 0   # Ticki, których obliczenie trwało dłużej niż dt
+        self.dropped_ticks = 0   # Ticki porzucone po przekroczeniu limitu nadrabiania
+        self.last_report = now
+        self.reported_overruns = 0
+        self.reported_drops = 0
+
+    def advance(self, now):
+        self.accumulator += now - self.last_time
+        self.last_time = now
+        steps = int(self.accumulator / self.dt)
+        if steps > self.max_catchup_ticks:
+            # Serwer nie nadąża: porzuć zaległość zamiast zamrozić się na nadrabianiu
+            self.dropped_ticks += steps - self.max_catchup_ticks
+            steps = self.max_catchup_ticks
+            self.accumulator = steps * self.dt
+        self.accumulator -= steps * self.dt
+        return steps
+
+    def record_tick(self, duration):
+        self.ticks += 1
+        if duration > self.dt:
+            self.overrun_ticks += 1
+
+    def time_until_next(self, now):
+        return max(0.0, self.dt - self.accumulator - (now - self.last_time))
+
+    def report(self, now):
+        if now - self.last_report < self.report_interval:
+            return
+        overruns = self.overrun_ticks - self.reported_overruns
+        drops = self.dropped_ticks - self.reported_drops
+        if overruns or drops:
+            print(f"Server falling behind: {overruns} overrun ticks, {drops} dropped ticks in the last {now - self.last_report:.0f}s")
+        self.last_report = now
+        self.reported_overruns = self.overrun_ticks
+        self.reported_drops = self.dropped_ticks
+
+# Kolejka połączeń czekających na accept (dziesiątki klientów naraz)
+LISTEN_BACKLOG = 128
+
+class ClientConnection(asyncio.BufferedProtocol):
+    # Połączenie jednego klienta w pętli zdarzeń serwera: handshake, join,
+    # potem wiadomości gry. Transport czyta prosto do FrameBuffer (recv_into),
+    # skąd bierzemy wszystkie pełne ramki z danego odczytu. Zapis nie blokuje:
+    # gdy bufor nadawczy przekroczy górny próg, snapshot czeka w jednym slocie
+    # (nowszy zastępuje niewysłany starszy) aż bufor opadnie do dolnego progu.
+    # Po udp_hello snapshoty i wiadomości idą przez UDP, a TCP tylko trzyma sesję
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.address = None
+        self.reader = FrameBuffer(4096)  # Od klienta idą tylko małe wiadomości
+        self.protocol = None
+        self.player_id = None
+        self.state = 'handshake'
+        self.pending_snapshot = None
+        self.saturated_since = None  # Od kiedy bufor nadawczy jest pełny
+        self.dropped_snapshots = 0
+        self.udp_token = secrets.randbits(32)
+        self.udp_addr = None
+        self.udp_channel = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.address = transport.get_extra_info('peername')
+        # Mały bufor jądra: zaległe dane zostają w transporcie, gdzie je widać
+        # i gdzie stary snapshot można jeszcze podmienić na nowszy
+        sock = transport.get_extra_info('socket')
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.server.socket_send_buffer)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        transport.set_write_buffer_limits(high=self.server.send_buffer_high, low=self.server.send_buffer_low)
+        print(f"New connection from {self.address}")
+
+    def get_buffer(self, sizehint):
+        return self.reader.get_buffer()
+
+    def buffer_updated(self, nbytes):
+        self.reader.buffer_updated(nbytes)
+        for payload in self.reader.frames():
+            try:
+                self.frame_received(payload)
+            except Exception as e:
+                print(f"Error handling client {self.address}: {e}")
+                self.close()
+                return
+
+    def frame_received(self, payload):
+        if self.state == 'playing':
+            self.server.handle_message(self.player_id, NetworkProtocol.parse_message(payload, self.protocol))
+        elif self.state == 'handshake':
+            version = NetworkProtocol.negotiate(bytes(payload), self.server.protocols)
+            if version is not None:
+                self.send(NetworkProtocol.handshake_reply(version))
+            if not version:
+                print(f"Rejected {self.address}: no common protocol version")
+                self.close()
+                return
+            self.protocol = version
+            # Dołączenie: id gracza i hash mapy, mapa tylko gdy klient jej nie ma
+            self.player_id = self.server.allocate_player_id()
+            # UDP tylko z formatem binarnym (datagramy bez ramek pickle)
+            udp = self.server.udp
+            udp_port = udp.port if udp is not None and version == PROTOCOL_BINARY else 0
+            self.send_message({
+                'type': 'join',
+                'data': {'player_id': self.player_id, 'udp_port': udp_port, 'udp_token': self.udp_token,
+                         'map_hash': self.server.map_hash}
+            })
+            self.state = 'join'
+        elif self.state == 'join':
+            reply = NetworkProtocol.parse_message(payload, self.protocol)
+            if reply['type'] != 'join_ack':
+                raise ConnectionError("expected join_ack")
+            if not reply['data']['have_map']:
+                self.send_message({'type': 'static_map', 'data': self.server.static_map})
+            self.server.add_client(self.player_id, self)
+            self.state = 'playing'
+
+    def send(self, frame):
+        if not self.transport.is_closing():
+            self.transport.write(frame)
+
+    def send_snapshot(self, payload):
+        # Po UDP tylko to, co mieści się w datagramie (pełne widoki idą po TCP)
+        if self.udp_addr is not None and self.udp_channel.fits(payload):
+            self.server.udp.send(self.udp_channel.unreliable(payload), self.udp_addr)
+            return
+        frame = NetworkProtocol.encode_frame(payload)
+        if self.saturated_since is None:
+            self.send(frame)
+            return
+        if self.pending_snapshot is not None:
+            self.dropped_snapshots += 1
+        self.pending_snapshot = frame
+
+    def pause_writing(self):
+        self.saturated_since = time.monotonic()
+
+    def resume_writing(self):
+        self.saturated_since = None
+        frame, self.pending_snapshot = self.pending_snapshot, None
+        if frame is not None:
+            self.send(frame)
+
+    def saturated_for(self, now):
+        return 0.0 if self.saturated_since is None else now - self.saturated_since
+
+    def send_message(self, message):
+        if self.udp_addr is not None:
+            payload = NetworkProtocol.create_message(message['type'], message['data'], self.protocol)
+            if self.udp_channel.fits(payload):
+                self.server.udp.send(self.udp_channel.reliable(payload, time.monotonic()), self.udp_addr)
+            else:
+                self.send(NetworkProtocol.encode_frame(payload))
+            return
+        self.send(NetworkProtocol.encode_message(message, self.protocol))
+
+    def close(self):
+        self.state = 'closed'
+        self.transport.close()
+
+    def abort(self):
+        # Bez czekania na opróżnienie bufora, którego klient i tak nie odbiera
+        self.state = 'closed'
+        self.transport.abort()
+
+    def connection_lost(self, exc):
+        if self.udp_addr is not None:
+            self.server.udp.peers.pop(self.udp_addr, None)
+            self.udp_addr = None
+        if self.player_id is not None:
+            self.server.remove_client(self.player_id)
+            self.player_id = None
+
+class UdpEndpoint(asyncio.DatagramProtocol):
+    # Opcjonalny transport UDP dla snapshotów i wejścia: zgubiony pakiet nie
+    # wstrzymuje kolejnych, jak segment w TCP. Adres klienta wiążemy z jego
+    # połączeniem TCP przez niezawodne udp_hello z tokenem z wiadomości join
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.port = None
+        self.send = None
+        self.peers = {}  # adres -> ClientConnection
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.port = transport.get_extra_info('sockname')[1]
+        self.send = transport.sendto
+        if self.server.udp_sim:
+            # Gubienie i opóźnianie pakietów do testów (tylko w tej pętli zdarzeń)
+            self.send = LossyLink(transport.sendto, call_later=asyncio.get_running_loop().call_later, **self.server.udp_sim)
+
+    def datagram_received(self, data, addr):
+        try:
+            connection = self.peers.get(addr)
+            if connection is None:
+                self.bind(data, addr)
+                return
+            for payload in connection.udp_channel.receive(data):
+                self.server.handle_message(connection.player_id, NetworkProtocol.parse_message(payload, connection.protocol))
+        except Exception as e:
+            print(f"Bad datagram from {addr}: {e}")
+
+    def bind(self, data, addr):
+        channel = UdpChannel()
+        for payload in channel.receive(data):
+            message = NetworkProtocol.parse_message(payload, PROTOCOL_BINARY)
+            if message['type'] != 'udp_hello':
+                continue
+            token = message['data']['token']
+            for connection in self.server.clients.values():
+                if connection.udp_token == token and connection.udp_addr is None:
+                    connection.udp_addr = addr
+                    connection.udp_channel = channel
+                    self.peers[addr] = connection
+                    print(f"Player {connection.player_id} switched to UDP from {addr}")
+                    return
+
+    def poll(self):
+        # Powtórki niepotwierdzonych wiadomości i same potwierdzenia
+        now = time.monotonic()
+        for addr, connection in list(self.peers.items()):
+            for datagram in connection.udp_channel.poll(now):
+                self.send(datagram, addr)
 
 class GameServer:
-    def __init__(self, host='0.0.0.0', port=5555):
+    def __init__(self, host='0.0.0.0', port=5555, tick_rate=60, allow_pickle=False, broadcast_rate=20,
+                 udp_port=None, udp_sim=None):
         self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server.bind((host, port))
-        self.server.listen(3)  # Allow up to 3 players
+        self.server.listen(LISTEN_BACKLOG)
+        self.host = host
+        # Port UDP dla klientów, które go wybiorą (None = tylko TCP, 0 = dowolny);
+        # udp_sim to argumenty LossyLink do testów na złym łączu
+        self.udp_port = udp_port
+        self.udp_sim = udp_sim
+        self.udp = None
         self.game_state = GameState()
         self.clients = {}
+        self.client_protocols = {}
+        self.reserved_player_ids = set()
+        self.client_acks = {}  # Ostatni snapshot potwierdzony przez klienta
+        self.snapshot_seq = 0
+        # Klienci interpolują między snapshotami, więc 10-20 Hz wystarcza
+        self.broadcast_rate = broadcast_rate
+        self.client_snapshots = {}  # player_id -> {seq: widok wysłany klientowi}
+        # Obszar zainteresowania (połowa boku kwadratu wokół gracza): pełne dane
+        # w pobliżu ekranu, same pozycje wrogów w zasięgu minimapy
+        self.aoi_radius = 700
+        self.minimap_radius = 1000
+        # Bufor nadawczy na klienta (bajty): powyżej górnego progu snapshoty
+        # nie są dopisywane, a klient nasycony dłużej niż send_stall_timeout
+        # sekund jest rozłączany
+        self.socket_send_buffer = 64 * 1024
+        self.send_buffer_high = 64 * 1024
+        self.send_buffer_low = 16 * 1024
+        self.send_stall_timeout = 3.0
+        # Pickle tylko na jawne życzenie (stare klienty); domyślnie format binarny
+        self.protocols = (PROTOCOL_BINARY, PROTOCOL_PICKLE) if allow_pickle else (PROTOCOL_BINARY,)
         self.running = True
         self.last_enemy_spawn = 0
         self.enemy_spawn_delay = 3  # seconds
         self.player_inputs = {}  # Store latest input for each player
+        # Wejścia odebrane, a jeszcze niezastosowane (po UDP kilka naraz);
+        # tick bierze jedno na gracza, w kolejności seq
+        self.input_queues = {}
+        self.max_input_backlog = 4
         self.last_shot_times = {}  # For special weapons
         self.game_over = False
         self.wave = 1
         self.wave_in_progress = False
         self.wave_cooldown = 0
         self.zombies_to_spawn = 0
+        self.max_enemies = 10  # Limit żywych przeciwników naraz
+        self.tick_count = 0
+        self.timestep = FixedTimestep(tick_rate)
+        self.sim_time_ms = time.time() * 1000
 
         # Initialize scores in game state
         self.game_state.scores = {}
 
         # Create some walls (simple maze)
-        self.game_state.walls = [
+        static_walls = [
             # Border walls (indestructible)
             Wall(0, 0, 4000, 20, is_indestructible=True),
             Wall(0, 2980, 4000, 20, is_indestructible=True),
@@ -85,8 +642,28 @@ class GameServer:
             Wall(1400, 2000, 20, 200, is_indestructible=True),
             Wall(2600, 2000, 20, 200, is_indestructible=True),
         ]
-        self.game_state.lootboxes = []
-        self.game_state.mines = []
+        # Siatka nawigacyjna budowana raz ze statycznej mapy
+        self.nav_grid = NavGrid()
+        self.wall_index = SpatialHash()
+        # Indeksy wrogów i graczy przebudowywane co tick przed kolizjami pocisków
+        self.enemy_index = EntityGrid()
+        self.player_index = EntityGrid()
+        for wall in static_walls:
+            self.add_wall(wall)
+        # Statyczna mapa idzie do klienta raz, przy dołączeniu (o ile nie ma
+        # jej w pamięci podręcznej pod tym samym hashem)
+        self.static_map = {'walls': [GameState.wall_to_dict(w) for w in self.game_state.walls if w.is_indestructible]}
+        self.map_hash = MapCache.content_hash(MapCache.encode(self.static_map))
+        # Pole przepływu liczone raz na kilka ticków zamiast A* dla każdego wroga
+        self.use_flow_field = True
+        self.flow_field = FlowField(self.nav_grid)
+        self.flow_field_interval = 6  # ticks
+        self.flow_field_built_at = 0
+        # Ścieżki A* zapamiętywane per wróg (gdy pole przepływu nie ma drogi)
+        self.path_replan_distance = 3  # cells
+        self.path_retry_ticks = 30  # Ponowienie nieudanego wyszukiwania
+        self.path_searches = 0
+        self.enemy_paths = {}  # net_id wroga -> EnemyPath
 
         # Define enemy spawn points
         self.enemy_spawn_points = [
@@ -113,24 +690,17 @@ class GameServer:
         print(f"Server started on {host}:{port}")
         print("Waiting for players to connect...")
 
-    def handle_client(self, client_socket, address):
-        player_id = len(self.clients)
-        
+    def add_client(self, player_id, connection):
         # Znajdź bezpieczne miejsce do spawnu
         spawn_successful = False
         spawn_attempts = 0
         spawn_x, spawn_y = 400, 300  # Domyślna pozycja spawnu
-        
+
         while not spawn_successful and spawn_attempts < 50:
             # Sprawdź czy pozycja spawnu nie koliduje ze ścianą
             player_rect = pygame.Rect(spawn_x - 30, spawn_y - 30, 60, 60)  # 30 to rozmiar gracza
-            collision = False
-            
-            for wall in self.game_state.walls:
-                if wall.rect.colliderect(player_rect):
-                    collision = True
-                    break
-            
+            collision = bool(self.wall_index.query_rect(player_rect))
+
             if not collision:
                 spawn_successful = True
             else:
@@ -140,85 +710,116 @@ class GameServer:
                 spawn_x = 400 + math.cos(angle) * distance
                 spawn_y = 300 + math.sin(angle) * distance
                 spawn_attempts += 1
-        
+
         # Jeśli nie znaleziono bezpiecznego miejsca, użyj domyślnej pozycji
         if not spawn_successful:
             print(f"Warning: Could not find safe spawn location for player {player_id}")
             spawn_x, spawn_y = 400, 300
-        
+
         player = Player(spawn_x, spawn_y, player_id)
         self.game_state.players[player_id] = player
-        self.clients[player_id] = client_socket
+        self.clients[player_id] = connection
+        self.client_protocols[player_id] = connection.protocol
         self.player_inputs[player_id] = {'dx': 0, 'dy': 0, 'angle': 0, 'shoot': False, 'mouse_x': 0, 'mouse_y': 0}
+        self.input_queues[player_id] = deque()
         self.last_shot_times[player_id] = 0
 
-        try:
-            while self.running:
-                message = NetworkProtocol.receive_message(client_socket)
-                if message is None:
-                    break
-                if message['type'] == 'player_input':
-                    if self.game_state.players[player_id].dead:
-                        continue
-                    data = message['data']
-                    self.player_inputs[player_id] = data
-                elif message['type'] == 'switch_weapon':
-                    idx = message['data']['selected_weapon_index']
-                    player = self.game_state.players.get(player_id)
-                    if player and 0 <= idx < len(player.weapons):
-                        player.selected_weapon_index = idx
-                        NetworkProtocol.send_message(client_socket, {
-                            'type': 'switch_weapon_ack',
-                            'data': {'selected_weapon_index': idx}
-                        })
-                elif message['type'] == 'restart_game':
-                    for p in self.game_state.players.values():
-                        p.respawn()
-                        # Reset input state for all players
-                        for pid in self.player_inputs:
-                            self.player_inputs[pid] = {'dx': 0, 'dy': 0, 'angle': 0, 'shoot': False, 'mouse_x': 0, 'mouse_y': 0}
-                    self.game_over = False
-                    self.wave = 1
-                    self.wave_cooldown = 0
-                    self.wave_in_progress = False
-                    self.zombies_to_spawn = 0
-                    self.game_state.scores = {}  # Reset scores on game restart
-        except Exception as e:
-            print(f"Error handling client {address}: {e}")
-        finally:
-            if player_id in self.game_state.players:
-                del self.game_state.players[player_id]
-            if player_id in self.clients:
-                del self.clients[player_id]
-            if player_id in self.player_inputs:
-                del self.player_inputs[player_id]
-            if player_id in self.last_shot_times:
-                del self.last_shot_times[player_id]
-            client_socket.close()
+    def handle_message(self, player_id, message):
+        if message['type'] == 'player_input':
+            # Po UDP wejście może przyjść spóźnione albo podwójnie
+            data = message['data']
+            queue = self.input_queues.setdefault(player_id, deque())
+            newest = queue[-1]['seq'] if queue else self.player_inputs[player_id].get('seq', 0)
+            if data['seq'] <= newest:
+                return
+            self.client_acks[player_id] = data.get('ack', 0)
+            # Kolejkujemy też wejście martwego gracza, żeby po odrodzeniu nie
+            # działało wejście sprzed śmierci
+            queue.append(data)
+            while len(queue) > self.max_input_backlog:
+                queue.popleft()
+        elif message['type'] == 'player_inputs':
+            for data in sorted(message['data']['inputs'], key=lambda data: data['seq']):
+                self.handle_message(player_id, {'type': 'player_input', 'data': data})
+        elif message['type'] == 'switch_weapon':
+            idx = message['data']['selected_weapon_index']
+            player = self.game_state.players.get(player_id)
+            if player and 0 <= idx < len(player.weapons):
+                player.selected_weapon_index = idx
+                self.clients[player_id].send_message({
+                    'type': 'switch_weapon_ack',
+                    'data': {'selected_weapon_index': idx}
+                })
+        elif message['type'] == 'restart_game':
+            for p in self.game_state.players.values():
+                p.respawn()
+                # Reset input state for all players
+                for pid in self.player_inputs:
+                    self.player_inputs[pid] = {'dx': 0, 'dy': 0, 'angle': 0, 'shoot': False, 'mouse_x': 0, 'mouse_y': 0}
+                for queue in self.input_queues.values():
+                    queue.clear()
+            self.game_over = False
+            self.wave = 1
+            self.wave_cooldown = 0
+            self.wave_in_progress = False
+            self.zombies_to_spawn = 0
+            self.game_state.scores = {}  # Reset scores on game restart
+
+    def remove_client(self, player_id):
+        if player_id in self.game_state.players:
+            del self.game_state.players[player_id]
+        if player_id in self.clients:
+            del self.clients[player_id]
+        if player_id in self.client_protocols:
+            del self.client_protocols[player_id]
+        if player_id in self.client_acks:
+            del self.client_acks[player_id]
+        if player_id in self.client_snapshots:
+            del self.client_snapshots[player_id]
+        if player_id in self.player_inputs:
+            del self.player_inputs[player_id]
+        self.input_queues.pop(player_id, None)
+        if player_id in self.last_shot_times:
+            del self.last_shot_times[player_id]
+        self.release_player_id(player_id)
+
+    def allocate_player_id(self):
+        # Najmniejsze wolne id, rezerwowane od handshake'u: dołączanie to kilka
+        # wymian wiadomości, zanim klient trafi do self.clients
+        player_id = 0
+        while player_id in self.reserved_player_ids:
+            player_id += 1
+        self.reserved_player_ids.add(player_id)
+        return player_id
+
+    def release_player_id(self, player_id):
+        self.reserved_player_ids.discard(player_id)
+
+    def add_wall(self, wall):
+        self.game_state.walls.append(wall)
+        self.nav_grid.add_wall(wall)
+        self.wall_index.insert(wall)
+
+    def remove_wall(self, wall):
+        self.game_state.walls.remove(wall)
+        self.nav_grid.remove_wall(wall)
+        self.wall_index.remove(wall)
+
+    def remove_enemy(self, enemy):
+        self.game_state.enemies.remove(enemy)
+        self.enemy_index.remove(enemy)
+        self.enemy_paths.pop(enemy.net_id, None)
 
     def has_line_of_sight(self, x1, y1, x2, y2):
         # Sprawdź czy między dwoma punktami nie ma ściany
-        # Użyj kilku punktów na linii dla lepszej dokładności
-        steps = 10
-        for i in range(steps + 1):
-            t = i / steps
-            check_x = x1 + (x2 - x1) * t
-            check_y = y1 + (y2 - y1) * t
-            
-            for wall in self.game_state.walls:
-                if wall.rect.collidepoint(check_x, check_y):
-                    return False
-        return True
+        return self.wall_index.raycast(x1, y1, x2, y2) is None
 
     def is_safe_spawn_position(self, x, y, size):
         # Sprawdź czy pozycja jest bezpieczna (nie koliduje ze ścianami)
         # Dodaj margines bezpieczeństwa
         margin = 10
         entity_rect = pygame.Rect(x - size - margin, y - size - margin, (size + margin)*2, (size + margin)*2)
-        for wall in self.game_state.walls:
-            if wall.rect.colliderect(entity_rect):
-                return False
-        return True
+        return not self.wall_index.query_rect(entity_rect)
 
     def find_safe_spawn_position(self, base_x, base_y, size, max_attempts=100):
         # Próbuj znaleźć bezpieczną pozycję wokół podanego punktu
@@ -282,16 +883,12 @@ class GameServer:
             angle_to_corner += random.uniform(-0.05, 0.05)
             
             # Sprawdź czy nowa pozycja jest bezpieczna
-            new_x = enemy.x + math.cos(angle_to_corner) * enemy.speed * (1/60)
-            new_y = enemy.y + math.sin(angle_to_corner) * enemy.speed * (1/60)
+            new_x = enemy.x + math.cos(angle_to_corner) * enemy.speed * self.timestep.dt
+            new_y = enemy.y + math.sin(angle_to_corner) * enemy.speed * self.timestep.dt
             new_rect = pygame.Rect(new_x - enemy.size, new_y - enemy.size, enemy.size*2, enemy.size*2)
             
-            # Sprawdź kolizje ze wszystkimi ścianami
-            collision = False
-            for other_wall in self.game_state.walls:
-                if other_wall.rect.colliderect(new_rect):
-                    collision = True
-                    break
+            # Sprawdź kolizje ze ścianami w pobliżu
+            collision = bool(self.wall_index.query_rect(new_rect))
             
             if not collision:
                 return math.cos(angle_to_corner) * enemy.speed, math.sin(angle_to_corner) * enemy.speed
@@ -304,492 +901,722 @@ class GameServer:
         
         return math.cos(target_angle) * enemy.speed, math.sin(target_angle) * enemy.speed
 
-    def get_grid(self, cell_size=40):
-        width, height = 4000, 3000
-        grid_w = width // cell_size
-        grid_h = height // cell_size
-        grid = [[0 for _ in range(grid_h)] for _ in range(grid_w)]
-        for wall in self.game_state.walls:
-            x0 = wall.rect.left // cell_size
-            x1 = (wall.rect.right-1) // cell_size
-            y0 = wall.rect.top // cell_size
-            y1 = (wall.rect.bottom-1) // cell_size
-            for gx in range(x0, x1+1):
-                for gy in range(y0, y1+1):
-                    if 0 <= gx < grid_w and 0 <= gy < grid_h:
-                        grid[gx][gy] = 1  # Blocked
-        return grid, cell_size, grid_w, grid_h
-
-    def astar(self, start, goal, grid, grid_w, grid_h):
-        def heuristic(a, b):
-            return abs(a[0]-b[0]) + abs(a[1]-b[1])
-        open_set = []
-        heapq.heappush(open_set, (0+heuristic(start, goal), 0, start, [start]))
+    def astar(self, start, goal, grid, grid_w, grid_h, diagonal=True, max_expansions=4000):
+        # A* z tablicą g-score i wskaźnikami na rodzica; ścieżka jest
+        # odtwarzana dopiero po dotarciu do celu
+        sqrt2 = math.sqrt(2)
+        gx_goal, gy_goal = goal
+
+        def heuristic(x, y):
+            # Odległość oktylna (dopuszczalna przy ruchu w 8 kierunkach)
+            ddx = abs(x - gx_goal)
+            ddy = abs(y - gy_goal)
+            if diagonal:
+                return (ddx + ddy) + (sqrt2 - 2) * min(ddx, ddy)
+            return ddx + ddy
+
+        if diagonal:
+            moves = [(-1, 0, 1), (1, 0, 1), (0, -1, 1), (0, 1, 1),
+                     (-1, -1, sqrt2), (1, -1, sqrt2), (-1, 1, sqrt2), (1, 1, sqrt2)]
+        else:
+            moves = [(-1, 0, 1), (1, 0, 1), (0, -1, 1), (0, 1, 1)]
+
+        g_score = {start: 0}
+        came_from = {}
         closed = set()
+        open_set = [(heuristic(*start), 0, start)]
+        expansions = 0
         while open_set:
-            _, cost, current, path = heapq.heappop(open_set)
+            _, cost, current = heapq.heappop(open_set)
             if current == goal:
+                path = [current]
+                while current in came_from:
+                    current = came_from[current]
+                    path.append(current)
+                path.reverse()
                 return path
             if current in closed:
                 continue
             closed.add(current)
-            for dx, dy in [(-1,0),(1,0),(0,-1),(0,1)]:
-                nx, ny = current[0]+dx, current[1]+dy
-                if 0 <= nx < grid_w and 0 <= ny < grid_h and grid[nx][ny]==0:
-                    heapq.heappush(open_set, (cost+1+heuristic((nx,ny), goal), cost+1, (nx,ny), path+[(nx,ny)]))
+            expansions += 1
+            if expansions > max_expansions:
+                return None
+            cx, cy = current
+            for dx, dy, step in moves:
+                nx, ny = cx + dx, cy + dy
+                if not (0 <= nx < grid_w and 0 <= ny < grid_h):
+                    continue
+                # Komórka celu może być zajęta (gracz przy ścianie), pozostałe muszą być wolne
+                if grid[nx][ny] != 0 and (nx, ny) != goal:
+                    continue
+                # Nie ścinaj rogów przy ruchu po skosie
+                if dx and dy and (grid[cx + dx][cy] != 0 or grid[cx][cy + dy] != 0):
+                    continue
+                neighbor = (nx, ny)
+                new_cost = cost + step
+                if new_cost < g_score.get(neighbor, float('inf')):
+                    g_score[neighbor] = new_cost
+                    came_from[neighbor] = current
+                    heapq.heappush(open_set, (new_cost + heuristic(nx, ny), new_cost, neighbor))
         return None
 
     def get_astar_path(self, x0, y0, x1, y1):
-        grid, cell_size, grid_w, grid_h = self.get_grid()
-        start = (int(x0)//cell_size, int(y0)//cell_size)
-        goal = (int(x1)//cell_size, int(y1)//cell_size)
-        path = self.astar(start, goal, grid, grid_w, grid_h)
-        if path and len(path) > 1:
+        nav = self.nav_grid
+        start = nav.cell_of(x0, y0)
+        goal = nav.cell_of(x1, y1)
+        self.path_searches += 1
+        return self.astar(start, goal, nav.grid, nav.grid_w, nav.grid_h)
+
+    def get_enemy_waypoint(self, enemy, target_x, target_y):
+        # Wróg idzie po zapamiętanej ścieżce i planuje ją od nowa tylko gdy
+        # cel odszedł o więcej niż path_replan_distance komórek, zmieniły się
+        # ściany albo wróg zszedł ze ścieżki
+        nav = self.nav_grid
+        cell = nav.cell_of(enemy.x, enemy.y)
+        goal = nav.cell_of(target_x, target_y)
+        path = self.enemy_paths.get(enemy.net_id)
+        replan = (
+            path is None
+            or path.nav_version != nav.version
+            or max(abs(goal[0] - path.goal[0]), abs(goal[1] - path.goal[1])) > self.path_replan_distance
+        )
+        if not replan:
+            if path.cells is None:
+                # Cel był nieosiągalny: nie szukamy co tick, tylko po odczekaniu
+                replan = self.tick_count >= path.retry_at
+            else:
+                # Przesuń się do komórki, w której wróg jest teraz (szukamy tylko tuż przed nim)
+                window_end = min(len(path.cells), path.index + 3)
+                for i in range(max(0, path.index - 1), window_end):
+                    if path.cells[i] == cell:
+                        path.index = i
+                        break
+                else:
+                    replan = True
+        if replan:
+            cells = self.get_astar_path(enemy.x, enemy.y, target_x, target_y)
+            path = EnemyPath(cells, goal, nav.version, self.tick_count + self.path_retry_ticks)
+            self.enemy_paths[enemy.net_id] = path
+        if path.cells is None:
+            return target_x, target_y
+        if path.index + 1 < len(path.cells):
             # Return next cell center
-            next_cell = path[1]
-            return next_cell[0]*cell_size+cell_size//2, next_cell[1]*cell_size+cell_size//2
-        return x1, y1
+            return nav.cell_center(*path.cells[path.index + 1])
+        return target_x, target_y
 
-    def update_game_state(self):
-        while self.running:
-            # --- Fale zombie ---
-            if not self.wave_in_progress and self.wave_cooldown <= 0:
-                self.wave_in_progress = True
-                self.zombies_to_spawn = 5 + self.wave
-                self.spawned_this_wave = 0
-            if self.wave_in_progress and self.zombies_to_spawn > 0:
-                if len(self.game_state.enemies) < 10:
-                    # Wybierz losowy punkt spawnu
-                    if self.wave % 5 == 0:  # Co 5 fal spawnuj bossa
-                        spawn_point = random.choice(self.boss_spawn_points)
-                        enemy_type = 5  # Boss
-                        is_boss_room_boss = True
-                    else:
-                        spawn_point = random.choice(self.enemy_spawn_points)
-                        enemy_type = random.randint(1, 4)
-                        is_boss_room_boss = False
-                    
-                    base_x, base_y = spawn_point
-                    
-                    # Stwórz tymczasowego przeciwnika aby sprawdzić jego rozmiar
-                    temp_enemy = Enemy(base_x, base_y, enemy_type)
+    def update_flow_field(self):
+        alive_positions = [(p.x, p.y) for p in self.game_state.players.values() if not p.dead]
+        if not alive_positions:
+            return
+        # Przelicz od razu po zmianie układu ścian, a po ruchu graczy
+        # najwyżej raz na flow_field_interval ticków
+        sources = frozenset(self.nav_grid.cell_of(x, y) for x, y in alive_positions)
+        if (self.flow_field.nav_version != self.nav_grid.version
+                or (sources != self.flow_field.sources and self.tick_count - self.flow_field_built_at >= self.flow_field_interval)):
+            self.flow_field_built_at = self.tick_count
+            self.flow_field.rebuild(alive_positions)
+
+    def _bucket_candidates(self, index, xs, ys):
+        # Obiekty z kubełków indeksu, w których leżą podane punkty (bez duplikatów)
+        cs = index.cell_size
+        keys = set(zip(np.floor(xs / cs).astype(int).tolist(), np.floor(ys / cs).astype(int).tolist()))
+        found = {}
+        for key in keys:
+            for item in index.buckets.get(key, ()):
+                found[id(item)] = item
+        return list(found.values())
+
+    def update_bullets(self, frame_scale=1.0):
+        pool = self.game_state.bullets
+        pool.update(frame_scale)
+
+        # Check bullet collisions with walls
+        live = np.flatnonzero(pool.alive[:pool.count])
+        walls = self._bucket_candidates(self.wall_index, pool.x[live], pool.y[live]) if len(live) else []
+        if walls:
+            bx = pool.x[live][:, None]
+            by = pool.y[live][:, None]
+            rects = np.array([(w.rect.left, w.rect.top, w.rect.right, w.rect.bottom) for w in walls], dtype=float)
+            inside = (bx >= rects[:, 0]) & (bx < rects[:, 2]) & (by >= rects[:, 1]) & (by < rects[:, 3])
+            for row in np.flatnonzero(inside.any(axis=1)).tolist():
+                b = live[row]
+                for col in np.flatnonzero(inside[row]).tolist():
+                    wall = walls[col]
+                    if wall.health <= 0:
+                        continue  # Ściana zniszczona wcześniej w tym ticku
+                    if not wall.is_indestructible:
+                        wall.health -= float(pool.damage[b])
+                        if wall.health <= 0:
+                            self.remove_wall(wall)
+                    pool.kill(b)
+                    break
+
+        # Check bullet collisions with enemies (tylko pociski graczy)
+        n = pool.count
+        live = np.flatnonzero(pool.alive[:n] & (pool.owner[:n] >= 0))
+        enemies = self._bucket_candidates(self.enemy_index, pool.x[live], pool.y[live]) if len(live) else []
+        if enemies:
+            ex = np.array([e.x for e in enemies])
+            ey = np.array([e.y for e in enemies])
+            esize = np.array([e.size for e in enemies], dtype=float)
+            hits = (pool.x[live][:, None] - ex) ** 2 + (pool.y[live][:, None] - ey) ** 2 < esize ** 2
+            for row in np.flatnonzero(hits.any(axis=1)).tolist():
+                b = live[row]
+                for col in np.flatnonzero(hits[row]).tolist():
+                    enemy = enemies[col]
+                    if enemy.health <= 0:
+                        continue  # Już zabity w tym ticku
+                    owner = int(pool.owner[b])
+                    damage = float(pool.damage[b])
+                    bullet_x = float(pool.x[b])
+                    bullet_y = float(pool.y[b])
+                    # Damage the enemy
+                    enemy.health -= damage
+                    if enemy.health <= 0:
+                        # Award points based on enemy type
+                        points = {
+                            1: 100,  # Basic zombie
+                            2: 200,  # Stronger zombie
+                            3: 500,  # Boss zombie
+                            4: 300,  # Shooter zombie
+                            5: 2000  # Boss zombie (więcej punktów)
+                        }.get(enemy.type, 100)
+                        
+                        # Initialize score for player if not exists
+                        if owner not in self.game_state.scores:
+                            self.game_state.scores[owner] = 0
+                        
+                        # Add points to player's score
+                        self.game_state.scores[owner] += points
+                        
+                        # Chance to drop health, armor or weapon
+                        drop_roll = random.random()
+                        if drop_roll < 0.2:  # 20% chance for health
+                            self.game_state.pickups.append(Pickup(enemy.x, enemy.y, 'health', 50))
+                        elif drop_roll < 0.3:  # 10% chance for armor
+                            self.game_state.pickups.append(Pickup(enemy.x, enemy.y, 'armor', 100))
+                        else:  # 70% chance for weapon
+                            # Boss z pokoju bossa zawsze upuszcza bazookę
+                            if enemy.type == 5 and getattr(enemy, 'is_boss_room_boss', False):
+                                bazooka = get_weapon_by_name("Bazooka")
+                                self.game_state.lootboxes.append(LootBox(enemy.x, enemy.y, bazooka))
+                            else:
+                                self.game_state.lootboxes.append(LootBox(enemy.x, enemy.y))
+                        
+                        self.remove_enemy(enemy)
                     
-                    # Znajdź bezpieczną pozycję spawnu
-                    spawn_x, spawn_y = self.find_safe_spawn_position(base_x, base_y, temp_enemy.size)
+                    # Handle explosive bullets
+                    if pool.is_explosive[b]:
+                        radius = float(pool.explosion_radius[b])
+                        # Apply explosion damage to all enemies within radius
+                        for other_enemy in self.enemy_index.query_radius(bullet_x, bullet_y, radius):
+                            if other_enemy != enemy:  # Skip the directly hit enemy
+                                distance = ((bullet_x - other_enemy.x) ** 2 + (bullet_y - other_enemy.y) ** 2) ** 0.5
+                                if distance < radius:
+                                    # Damage decreases with distance
+                                    damage_multiplier = 1 - (distance / radius)
+                                    explosion_damage = int(damage * damage_multiplier)
+                                    other_enemy.health -= explosion_damage
+                                    if other_enemy.health <= 0:
+                                        self.remove_enemy(other_enemy)
                     
-                    if self.wave % 5 == 0:
-                        self.game_state.enemies = []  # Usuń wszystkich innych przeciwników
-                        boss = Enemy(spawn_x, spawn_y, enemy_type)
-                        boss.is_boss_room_boss = is_boss_room_boss
-                        self.game_state.enemies.append(boss)
-                        self.zombies_to_spawn = 0
-                    else:
-                        self.game_state.enemies.append(Enemy(spawn_x, spawn_y, enemy_type))
-                        self.zombies_to_spawn -= 1
-
-            if self.wave_in_progress and self.zombies_to_spawn == 0 and len(self.game_state.enemies) == 0:
-                self.wave_in_progress = False
-                self.wave_cooldown = 5
-                self.wave += 1
-            if not self.wave_in_progress and self.wave_cooldown > 0:
-                self.wave_cooldown -= 1/60
-                if self.wave_cooldown < 0:
-                    self.wave_cooldown = 0
-            self.game_state.wave = self.wave
-            self.game_state.wave_cooldown = self.wave_cooldown
-
-            all_dead = True
-            for player in self.game_state.players.values():
-                if player.dead:
-                    if player.respawn_timer > 0:
-                        player.respawn_timer -= 1/60
-                        if player.respawn_timer <= 0:
-                            player.respawn()
-                    continue
-                all_dead = False
-            if all_dead and len(self.game_state.players) > 0:
-                self.game_over = True
-            else:
-                self.game_over = False
-            self.game_state.game_over = self.game_over
+                    # Remove the bullet
+                    pool.kill(b)
+                    break
 
-            # Update player positions based on input
-            for pid, player in self.game_state.players.items():
+        # Check bullet collisions with players
+        live = np.flatnonzero(pool.alive[:n])
+        players = self._bucket_candidates(self.player_index, pool.x[live], pool.y[live]) if len(live) else []
+        if players:
+            px = np.array([p.x for p in players])
+            py = np.array([p.y for p in players])
+            psize = np.array([p.size for p in players], dtype=float)
+            pid = np.array([p.player_id for p in players])
+            owner = pool.owner[live][:, None]
+            # Pociski wrogów (player_id == -1) kolidują z graczami
+            # Pociski graczy (player_id >= 0) nie kolidują z własnym graczem
+            can_hit = (owner == -1) | ((owner >= 0) & (owner != pid))
+            hits = can_hit & ((pool.x[live][:, None] - px) ** 2 + (pool.y[live][:, None] - py) ** 2 < psize ** 2)
+            for row in np.flatnonzero(hits.any(axis=1)).tolist():
+                b = live[row]
+                for col in np.flatnonzero(hits[row]).tolist():
+                    player = players[col]
+                    if player.dead:
+                        continue
+                    # Gracz otrzymał obrażenia od pocisku wroga lub innego gracza
+                    player.take_damage(float(pool.damage[b]))
+                    if player.health <= 0 and not player.dead:
+                        player.kill()
+                    pool.kill(b)
+                    break # Pocisk trafił w gracza, usuń pocisk
+
+        pool.compact()
+
+    async def update_game_state(self):
+        # Symulacja ze stałym krokiem: akumulator na zegarze monotonicznym
+        # nadrabia spóźnione ticki (do limitu) zamiast spowalniać grę. Tick
+        # działa w pętli zdarzeń, więc wejścia klientów nie ścigają się z nim
+        clock = self.timestep
+        clock.reset(time.monotonic())
+        while self.running:
+            for _ in range(clock.advance(time.monotonic())):
+                tick_start = time.monotonic()
+                self.tick(clock.dt)
+                clock.record_tick(time.monotonic() - tick_start)
+            clock.report(time.monotonic())
+            await asyncio.sleep(clock.time_until_next(time.monotonic()))
+
+    def tick(self, dt):
+        # Czas symulacji (ms) używany do limitów szybkostrzelności
+        self.sim_time_ms += dt * 1000
+        # Prędkości graczy i pocisków są podane w px na klatkę przy 60 Hz
+        frame_scale = dt * 60
+        # --- Fale zombie ---
+        if not self.wave_in_progress and self.wave_cooldown <= 0:
+            self.wave_in_progress = True
+            self.zombies_to_spawn = 5 + self.wave
+            self.spawned_this_wave = 0
+        if self.wave_in_progress and self.zombies_to_spawn > 0:
+            if len(self.game_state.enemies) < self.max_enemies:
+                # Wybierz losowy punkt spawnu
+                if self.wave % 5 == 0:  # Co 5 fal spawnuj bossa
+                    spawn_point = random.choice(self.boss_spawn_points)
+                    enemy_type = 5  # Boss
+                    is_boss_room_boss = True
+                else:
+                    spawn_point = random.choice(self.enemy_spawn_points)
+                    enemy_type = random.randint(1, 4)
+                    is_boss_room_boss = False
+                
+                base_x, base_y = spawn_point
+                
+                # Stwórz tymczasowego przeciwnika aby sprawdzić jego rozmiar
+                temp_enemy = Enemy(base_x, base_y, enemy_type)
+                
+                # Znajdź bezpieczną pozycję spawnu
+                spawn_x, spawn_y = self.find_safe_spawn_position(base_x, base_y, temp_enemy.size)
+                
+                if self.wave % 5 == 0:
+                    self.game_state.enemies.clear()  # Usuń wszystkich innych przeciwników
+                    self.enemy_paths.clear()
+                    boss = Enemy(spawn_x, spawn_y, enemy_type)
+                    boss.is_boss_room_boss = is_boss_room_boss
+                    self.game_state.enemies.append(boss)
+                    self.zombies_to_spawn = 0
+                else:
+                    self.game_state.enemies.append(Enemy(spawn_x, spawn_y, enemy_type))
+                    self.zombies_to_spawn -= 1
+
+        if self.wave_in_progress and self.zombies_to_spawn == 0 and len(self.game_state.enemies) == 0:
+            self.wave_in_progress = False
+            self.wave_cooldown = 5
+            self.wave += 1
+        if not self.wave_in_progress and self.wave_cooldown > 0:
+            self.wave_cooldown -= dt
+            if self.wave_cooldown < 0:
+                self.wave_cooldown = 0
+        self.game_state.wave = self.wave
+        self.game_state.wave_cooldown = self.wave_cooldown
+
+        all_dead = True
+        for player in self.game_state.players.values():
+            if player.dead:
+                if player.respawn_timer > 0:
+                    player.respawn_timer -= dt
+                    if player.respawn_timer <= 0:
+                        player.respawn()
+                continue
+            all_dead = False
+        if all_dead and len(self.game_state.players) > 0:
+            self.game_over = True
+        else:
+            self.game_over = False
+        self.game_state.game_over = self.game_over
+
+        # Update player positions based on input
+        for pid, player in self.game_state.players.items():
+            queue = self.input_queues.get(pid)
+            if queue:
                 if player.dead:
-                    continue
-                input_data = self.player_inputs.get(pid, {'dx': 0, 'dy': 0, 'angle': 0, 'shoot': False, 'mouse_x': player.x, 'mouse_y': player.y})
-                dx = input_data['dx']
-                dy = input_data['dy']
-                angle = input_data['angle']
-                shoot = input_data['shoot']
-                mouse_x = input_data.get('mouse_x', player.x)
-                mouse_y = input_data.get('mouse_y', player.y)
-
-                # Normalize diagonal movement
-                if dx != 0 and dy != 0:
-                    dx *= 0.7071
-                    dy *= 0.7071
-
-                # Ruch gracza z kolizją ścian
-                new_x = player.x + dx * player.speed * 2.0  # Stała, wyższa prędkość
-                new_y = player.y + dy * player.speed * 2.0  # Stała, wyższa prędkość
-                player_rect = pygame.Rect(new_x - player.size, new_y - player.size, player.size*2, player.size*2)
-                collision = False
-                for wall in self.game_state.walls:
-                    if wall.rect.colliderect(player_rect):
-                        collision = True
-                        break
-                if not collision:
-                    player.x = new_x
-                    player.y = new_y
-                player.angle = angle
-
-                # Special weapon logic
-                weapon = getattr(player, 'current_weapon', None)
-                now = time.time() * 1000
-                if shoot and weapon:
-                    if weapon.special_type == 'wall':
-                        if now - self.last_shot_times.get(pid, 0) > weapon.fire_rate and player.ammo.get(weapon.name, 0) > 0:
-                            self.last_shot_times[pid] = now
-                            wall_w, wall_h = 40, 40
-                            self.game_state.walls.append(Wall(mouse_x - wall_w//2, mouse_y - wall_h//2, wall_w, wall_h, is_player_wall=True))
-                            player.ammo[weapon.name] -= 1 # Consume ammo for wall spawner
-
-                    elif weapon.special_type == 'mine':
-                        if now - self.last_shot_times.get(pid, 0) > weapon.fire_rate and player.ammo.get(weapon.name, 0) > 0:
-                            self.last_shot_times[pid] = now
-                            # Sprawdź czy miejsce na minę nie koliduje ze ścianą
-                            mine_size = 12  # Rozmiar miny
-                            mine_rect = pygame.Rect(mouse_x - mine_size, mouse_y - mine_size, mine_size*2, mine_size*2)
-                            can_place = True
-                            for wall in self.game_state.walls:
-                                if wall.rect.colliderect(mine_rect):
-                                    can_place = False
-                                    break
-                            
-                            if can_place:
-                                self.game_state.mines.append(Mine(mouse_x, mouse_y, pid, weapon.damage))
-                                player.ammo[weapon.name] -= 1 # Consume ammo for mine placer
-
-                    elif weapon.name == "Shotgun": # Handle Shotgun
-                         if now - self.last_shot_times.get(pid, 0) > weapon.fire_rate and player.ammo.get(weapon.name, 0) > 0:
-                             self.last_shot_times[pid] = now
-                             player.ammo[weapon.name] -= 1 # Consume ammo
-                             # Create multiple bullets with spread
-                             spread_angle = 15 # Degrees total spread
-                             num_bullets = 3
-                             for i in range(num_bullets):
-                                 angle_offset = (i - (num_bullets - 1) / 2) * (spread_angle / num_bullets)
-                                 bullet_angle = player.angle + angle_offset
-                                 # Use a different color for shotgun bullets to distinguish them
-                                 shotgun_bullet = Bullet(player.x, player.y, bullet_angle, player.player_id, weapon)
-                                 shotgun_bullet.color = (255, 165, 0) # Orange color for shotgun bullets
-                                 self.game_state.bullets.append(shotgun_bullet)
-
-                    else: # Handle regular bullets (Pistol, Weapon 2, Weapon 3)
-                        if now - self.last_shot_times.get(pid, 0) > weapon.fire_rate and player.ammo.get(weapon.name, 0) > 0: # Check ammo for regular guns too
-                            self.last_shot_times[pid] = now
-                            player.ammo[weapon.name] -= 1 # Consume ammo
-                            bullet = Bullet(player.x, player.y, player.angle, player.player_id, weapon)
-                            self.game_state.bullets.append(bullet)
-
-            # Update bullets
-            for bullet in self.game_state.bullets[:]:
-                bullet.update()
-                if bullet.lifetime <= 0:
-                    self.game_state.bullets.remove(bullet)
-                    continue
+                    # Martwy gracz nie zużywa wejść; po odrodzeniu działa najnowsze
+                    self.player_inputs[pid] = queue[-1]
+                    queue.clear()
+                else:
+                    self.player_inputs[pid] = queue.popleft()
+            if player.dead:
+                continue
+            input_data = self.player_inputs.get(pid, {'dx': 0, 'dy': 0, 'angle': 0, 'shoot': False, 'mouse_x': player.x, 'mouse_y': player.y})
+            dx = input_data['dx']
+            dy = input_data['dy']
+            angle = input_data['angle']
+            shoot = input_data['shoot']
+            mouse_x = input_data.get('mouse_x', player.x)
+            mouse_y = input_data.get('mouse_y', player.y)
 
-                # Check bullet collisions with walls
-                for wall in self.game_state.walls[:]:
-                    if wall.rect.collidepoint(bullet.x, bullet.y):
-                        if not wall.is_indestructible:
-                            wall.health -= bullet.damage
-                            if wall.health <= 0:
-                                self.game_state.walls.remove(wall)
-                        if bullet in self.game_state.bullets:
-                            self.game_state.bullets.remove(bullet)
-                        break
+            # Ruch gracza z kolizją ścian (te same zasady przewiduje klient)
+            player.step(dx, dy, frame_scale, self.wall_index.query_rect)
+            player.angle = angle
+            seq = input_data.get('seq', 0)
+            if seq == player.last_input_seq:
+                # Pole 'H' na łączu; po 65535 tickach (~18 min) to samo wejście
+                # i tak nie różni się dla przewidywania klienta
+                player.input_ticks = min(player.input_ticks + 1, 0xFFFF)
+            else:
+                player.last_input_seq = seq
+                player.input_ticks = 1
 
-                # Check bullet collisions with enemies
-                for enemy in self.game_state.enemies[:]:
-                    if bullet.player_id >= 0 and ((bullet.x - enemy.x) ** 2 + (bullet.y - enemy.y) ** 2) ** 0.5 < enemy.size:
-                        # Damage the enemy
-                        enemy.health -= bullet.damage if hasattr(bullet, 'damage') else 25
-                        if enemy.health <= 0:
-                            # Award points based on enemy type
-                            points = {
-                                1: 100,  # Basic zombie
-                                2: 200,  # Stronger zombie
-                                3: 500,  # Boss zombie
-                                4: 300,  # Shooter zombie
-                                5: 2000  # Boss zombie (więcej punktów)
-                            }.get(enemy.type, 100)
-                            
-                            # Initialize score for player if not exists
-                            if bullet.player_id not in self.game_state.scores:
-                                self.game_state.scores[bullet.player_id] = 0
-                            
-                            # Add points to player's score
-                            self.game_state.scores[bullet.player_id] += points
-                            
-                            # Chance to drop health, armor or weapon
-                            drop_roll = random.random()
-                            if drop_roll < 0.2:  # 20% chance for health
-                                self.game_state.pickups.append(Pickup(enemy.x, enemy.y, 'health', 50))
-                            elif drop_roll < 0.3:  # 10% chance for armor
-                                self.game_state.pickups.append(Pickup(enemy.x, enemy.y, 'armor', 100))
-                            else:  # 70% chance for weapon
-                                # Boss z pokoju bossa zawsze upuszcza bazookę
-                                if enemy.type == 5 and getattr(enemy, 'is_boss_room_boss', False):
-                                    bazooka = get_weapon_by_name("Bazooka")
-                                    self.game_state.lootboxes.append(LootBox(enemy.x, enemy.y, bazooka))
-                                else:
-                                    self.game_state.lootboxes.append(LootBox(enemy.x, enemy.y))
-                            
-                            self.game_state.enemies.remove(enemy)
-                        
-                        # Handle explosive bullets
-                        if bullet.is_explosive:
-                            # Apply explosion damage to all enemies within radius
-                            for other_enemy in self.game_state.enemies[:]:
-                                if other_enemy != enemy:  # Skip the directly hit enemy
-                                    distance = ((bullet.x - other_enemy.x) ** 2 + (bullet.y - other_enemy.y) ** 2) ** 0.5
-                                    if distance < bullet.explosion_radius:
-                                        # Damage decreases with distance
-                                        damage_multiplier = 1 - (distance / bullet.explosion_radius)
-                                        explosion_damage = int(bullet.damage * damage_multiplier)
-                                        other_enemy.health -= explosion_damage
-                                        if other_enemy.health <= 0:
-                                            self.game_state.enemies.remove(other_enemy)
+            # Special weapon logic
+            weapon = getattr(player, 'current_weapon', None)
+            now = self.sim_time_ms
+            if shoot and weapon:
+                if weapon.special_type == 'wall':
+                    if now - self.last_shot_times.get(pid, 0) > weapon.fire_rate and player.ammo.get(weapon.name, 0) > 0:
+                        self.last_shot_times[pid] = now
+                        wall_w, wall_h = 40, 40
+                        self.add_wall(Wall(mouse_x - wall_w//2, mouse_y - wall_h//2, wall_w, wall_h, is_player_wall=True))
+                        player.ammo[weapon.name] -= 1 # Consume ammo for wall spawner
+
+                elif weapon.special_type == 'mine':
+                    if now - self.last_shot_times.get(pid, 0) > weapon.fire_rate and player.ammo.get(weapon.name, 0) > 0:
+                        self.last_shot_times[pid] = now
+                        # Sprawdź czy miejsce na minę nie koliduje ze ścianą
+                        mine_size = 12  # Rozmiar miny
+                        mine_rect = pygame.Rect(mouse_x - mine_size, mouse_y - mine_size, mine_size*2, mine_size*2)
+                        can_place = not self.wall_index.query_rect(mine_rect)
                         
-                        # Remove the bullet
-                        if bullet in self.game_state.bullets:
-                            self.game_state.bullets.remove(bullet)
-                            break
+                        if can_place:
+                            self.game_state.mines.append(Mine(mouse_x, mouse_y, pid, weapon.damage))
+                            player.ammo[weapon.name] -= 1 # Consume ammo for mine placer
 
-                # Check bullet collisions with players
-                for player in self.game_state.players.values():
-                    # Pociski wrogów (player_id == -1) kolidują z graczami
-                    # Pociski graczy (player_id >= 0) nie kolidują z własnymi graczami (sprawdzane przez player.player_id != bullet.player_id)
-                    if bullet.player_id == -1 or (bullet.player_id >= 0 and player.player_id != bullet.player_id):
-                        if not player.dead:
-                            if ((bullet.x - player.x) ** 2 + (bullet.y - player.y) ** 2) ** 0.5 < player.size:
-                                # Gracz otrzymał obrażenia od pocisku wroga lub innego gracza
-                                player.take_damage(bullet.damage)
-                                if player.health <= 0 and not player.dead:
-                                    player.kill()
-                                if bullet in self.game_state.bullets:
-                                    self.game_state.bullets.remove(bullet)
-                                break # Pocisk trafił w gracza, usuń pocisk
-
-            # Player picks up items
-            for player in self.game_state.players.values():
-                if player.dead:
-                    continue
+                elif weapon.name == "Shotgun": # Handle Shotgun
+                     if now - self.last_shot_times.get(pid, 0) > weapon.fire_rate and player.ammo.get(weapon.name, 0) > 0:
+                         self.last_shot_times[pid] = now
+                         player.ammo[weapon.name] -= 1 # Consume ammo
+                         # Create multiple bullets with spread
+                         spread_angle = 15 # Degrees total spread
+                         num_bullets = 3
+                         for i in range(num_bullets):
+                             angle_offset = (i - (num_bullets - 1) / 2) * (spread_angle / num_bullets)
+                             bullet_angle = player.angle + angle_offset
+                             # Use a different color for shotgun bullets to distinguish them
+                             shotgun_bullet = Bullet(player.x, player.y, bullet_angle, player.player_id, weapon)
+                             shotgun_bullet.color = (255, 165, 0) # Orange color for shotgun bullets
+                             self.game_state.bullets.add(shotgun_bullet)
+
+                else: # Handle regular bullets (Pistol, Weapon 2, Weapon 3)
+                    if now - self.last_shot_times.get(pid, 0) > weapon.fire_rate and player.ammo.get(weapon.name, 0) > 0: # Check ammo for regular guns too
+                        self.last_shot_times[pid] = now
+                        player.ammo[weapon.name] -= 1 # Consume ammo
+                        bullet = Bullet(player.x, player.y, player.angle, player.player_id, weapon)
+                        self.game_state.bullets.add(bullet)
+
+        # Przebuduj indeksy jednostek (pozycje są stałe aż do ruchu wrogów)
+        self.enemy_index.rebuild(self.game_state.enemies)
+        self.player_index.rebuild([p for p in self.game_state.players.values() if not p.dead])
+
+        # Update bullets
+        self.update_bullets(frame_scale)
+
+        # Player picks up items
+        for player in self.game_state.players.values():
+            if player.dead:
+                continue
+            
+            # Check for pickup collisions
+            for pickup in list(self.game_state.pickups):
+                if ((player.x - pickup.x) ** 2 + (player.y - pickup.y) ** 2) ** 0.5 < player.size + pickup.size:
+                    if pickup.pickup_type == 'health':
+                        player.add_health(pickup.value)
+                    else:  # armor
+                        player.add_armor(pickup.value)
+                    self.game_state.pickups.remove(pickup)
+
+            # Check for lootbox collisions
+            for lootbox in list(self.game_state.lootboxes):
+                if ((player.x - lootbox.x) ** 2 + (player.y - lootbox.y) ** 2) ** 0.5 < player.size + lootbox.size:
+                    player.add_weapon(lootbox.weapon)
+                    self.game_state.lootboxes.remove(lootbox)
+
+        # Update mines and check for explosions
+        for mine in list(self.game_state.mines):
+            # Check for player or enemy contact to activate mine
+            if not mine.active:
+                # Check player contact
+                for player in self.player_index.query_radius(mine.x, mine.y, mine.size):
+                    if not player.dead and ((mine.x - player.x) ** 2 + (mine.y - player.y) ** 2) ** 0.5 < player.size + mine.size:
+                        mine.active = True
+                        mine.activation_timer = mine.activation_delay
+                        break
                 
-                # Check for pickup collisions
-                for pickup in self.game_state.pickups[:]:
-                    if ((player.x - pickup.x) ** 2 + (player.y - pickup.y) ** 2) ** 0.5 < player.size + pickup.size:
-                        if pickup.pickup_type == 'health':
-                            player.add_health(pickup.value)
-                        else:  # armor
-                            player.add_armor(pickup.value)
-                        self.game_state.pickups.remove(pickup)
-
-                # Check for lootbox collisions
-                for lootbox in self.game_state.lootboxes[:]:
-                    if ((player.x - lootbox.x) ** 2 + (player.y - lootbox.y) ** 2) ** 0.5 < player.size + lootbox.size:
-                        player.add_weapon(lootbox.weapon)
-                        self.game_state.lootboxes.remove(lootbox)
-
-            # Update mines and check for explosions
-            for mine in self.game_state.mines[:]:
-                # Check for player or enemy contact to activate mine
+                # Check enemy contact
                 if not mine.active:
-                    # Check player contact
-                    for player in self.game_state.players.values():
-                        if not player.dead and ((mine.x - player.x) ** 2 + (mine.y - player.y) ** 2) ** 0.5 < player.size + mine.size:
+                    for enemy in self.enemy_index.query_radius(mine.x, mine.y, mine.size):
+                        if ((mine.x - enemy.x) ** 2 + (mine.y - enemy.y) ** 2) ** 0.5 < enemy.size + mine.size:
                             mine.active = True
                             mine.activation_timer = mine.activation_delay
                             break
-                    
-                    # Check enemy contact
-                    if not mine.active:
-                        for enemy in self.game_state.enemies:
-                            if ((mine.x - enemy.x) ** 2 + (mine.y - enemy.y) ** 2) ** 0.5 < enemy.size + mine.size:
-                                mine.active = True
-                                mine.activation_timer = mine.activation_delay
-                                break
-                
-                # Update activation timer if mine is active
-                if mine.active:
-                    mine.activation_timer -= 1/60
-                    if mine.activation_timer <= 0:
-                        # Mine explodes
-                        # Apply damage to players
-                        for player in self.game_state.players.values():
-                            if not player.dead:
-                                distance = ((mine.x - player.x) ** 2 + (mine.y - player.y) ** 2) ** 0.5
-                                if distance < mine.explosion_radius:
-                                    # Damage decreases with distance
-                                    damage_multiplier = 1 - (distance / mine.explosion_radius)
-                                    damage = int(mine.damage * damage_multiplier)
-                                    player.take_damage(damage)
-                        
-                        # Apply damage to enemies
-                        for enemy in self.game_state.enemies[:]:
-                            distance = ((mine.x - enemy.x) ** 2 + (mine.y - enemy.y) ** 2) ** 0.5
+            
+            # Update activation timer if mine is active
+            if mine.active:
+                mine.activation_timer -= dt
+                if mine.activation_timer <= 0:
+                    # Mine explodes
+                    # Apply damage to players
+                    for player in self.player_index.query_radius(mine.x, mine.y, mine.explosion_radius):
+                        if not player.dead:
+                            distance = ((mine.x - player.x) ** 2 + (mine.y - player.y) ** 2) ** 0.5
                             if distance < mine.explosion_radius:
                                 # Damage decreases with distance
                                 damage_multiplier = 1 - (distance / mine.explosion_radius)
                                 damage = int(mine.damage * damage_multiplier)
-                                enemy.health -= damage
-                                if enemy.health <= 0:
-                                    # Award points for mine kills
-                                    points = {
-                                        1: 150,  # Extra points for mine kills
-                                        2: 300,
-                                        3: 750,
-                                        4: 450
-                                    }.get(enemy.type, 150)
-                                    
-                                    # Initialize score for player if not exists
-                                    if mine.owner_id not in self.game_state.scores:
-                                        self.game_state.scores[mine.owner_id] = 0
-                                    
-                                    # Add points to player's score
-                                    self.game_state.scores[mine.owner_id] += points
-                                    
-                                    self.game_state.lootboxes.append(LootBox(enemy.x, enemy.y))
-                                    self.game_state.enemies.remove(enemy)
-                        
-                        # Remove the exploded mine
-                        self.game_state.mines.remove(mine)
-                        break  # Break since we modified the list we're iterating over
-
-            # Update enemy movement and actions
-            dt = 1/60
-            now = time.time() * 1000
-            for enemy in self.game_state.enemies[:]:
-                # Sprawdź czy przeciwnik nie utknął w ścianie
-                enemy_rect = pygame.Rect(enemy.x - enemy.size, enemy.y - enemy.size, enemy.size*2, enemy.size*2)
-                stuck = False
-                for wall in self.game_state.walls:
-                    if wall.rect.colliderect(enemy_rect):
-                        stuck = True
-                        # Zamiast teleportować, spróbuj delikatnie przesunąć przeciwnika
-                        angle = math.atan2(enemy.y - wall.rect.centery, enemy.x - wall.rect.centerx)
-                        enemy.x += math.cos(angle) * 5
-                        enemy.y += math.sin(angle) * 5
-                        break
-                
-                if stuck:
-                    continue  # Pomiń resztę logiki dla tej klatki
+                                player.take_damage(damage)
+                    
+                    # Apply damage to enemies
+                    for enemy in self.enemy_index.query_radius(mine.x, mine.y, mine.explosion_radius):
+                        distance = ((mine.x - enemy.x) ** 2 + (mine.y - enemy.y) ** 2) ** 0.5
+                        if distance < mine.explosion_radius:
+                            # Damage decreases with distance
+                            damage_multiplier = 1 - (distance / mine.explosion_radius)
+                            damage = int(mine.damage * damage_multiplier)
+                            enemy.health -= damage
+                            if enemy.health <= 0:
+                                # Award points for mine kills
+                                points = {
+                                    1: 150,  # Extra points for mine kills
+                                    2: 300,
+                                    3: 750,
+                                    4: 450
+                                }.get(enemy.type, 150)
+                                
+                                # Initialize score for player if not exists
+                                if mine.owner_id not in self.game_state.scores:
+                                    self.game_state.scores[mine.owner_id] = 0
+                                
+                                # Add points to player's score
+                                self.game_state.scores[mine.owner_id] += points
+                                
+                                self.game_state.lootboxes.append(LootBox(enemy.x, enemy.y))
+                                self.remove_enemy(enemy)
+                    
+                    # Remove the exploded mine
+                    self.game_state.mines.remove(mine)
+                    break  # Break since we modified the list we're iterating over
 
-                alive_players = [p for p in self.game_state.players.values() if not p.dead]
-                target_player = None
-                
-                if alive_players:
-                    target_player = min(alive_players, key=lambda p: ((p.x - enemy.x) ** 2 + (p.y - enemy.y) ** 2) ** 0.5)
-                    distance_to_player = ((enemy.x - target_player.x) ** 2 + (enemy.y - target_player.y) ** 2) ** 0.5
-                    has_los = self.has_line_of_sight(enemy.x, enemy.y, target_player.x, target_player.y)
-                    if enemy._is_shooter and distance_to_player < 300 and has_los:
-                        target_dx, target_dy = 0, 0
-                        target_angle_deg = math.degrees(math.atan2(target_player.y - enemy.y, target_player.x - enemy.x))
-                        
-                        if now - enemy._last_shot > enemy._fire_rate:
-                            enemy._last_shot = now
-                            enemy_bullet = Bullet(enemy.x, enemy.y, target_angle_deg, -1)
-                            enemy_bullet.damage = enemy._bullet_damage
-                            enemy_bullet.speed = enemy._bullet_speed
-                            enemy_bullet.color = (255, 0, 0)
-                            enemy_bullet.start_x = enemy.x
-                            enemy_bullet.start_y = enemy.y
-                            self.game_state.bullets.append(enemy_bullet)
+        # Update enemy movement and actions
+        now = self.sim_time_ms
+        self.tick_count += 1
+        if self.use_flow_field:
+            self.update_flow_field()
+        for enemy in list(self.game_state.enemies):
+            # Sprawdź czy przeciwnik nie utknął w ścianie
+            enemy_rect = pygame.Rect(enemy.x - enemy.size, enemy.y - enemy.size, enemy.size*2, enemy.size*2)
+            stuck = False
+            for wall in self.wall_index.query_rect(enemy_rect):
+                stuck = True
+                # Zamiast teleportować, spróbuj delikatnie przesunąć przeciwnika
+                angle = math.atan2(enemy.y - wall.rect.centery, enemy.x - wall.rect.centerx)
+                enemy.x += math.cos(angle) * 5 * frame_scale
+                enemy.y += math.sin(angle) * 5 * frame_scale
+                break
+            
+            if stuck:
+                continue  # Pomiń resztę logiki dla tej klatki
+
+            alive_players = [p for p in self.game_state.players.values() if not p.dead]
+            target_player = None
+            
+            if alive_players:
+                target_player = min(alive_players, key=lambda p: ((p.x - enemy.x) ** 2 + (p.y - enemy.y) ** 2) ** 0.5)
+                distance_to_player = ((enemy.x - target_player.x) ** 2 + (enemy.y - target_player.y) ** 2) ** 0.5
+                has_los = self.has_line_of_sight(enemy.x, enemy.y, target_player.x, target_player.y)
+                if enemy._is_shooter and distance_to_player < 300 and has_los:
+                    target_dx, target_dy = 0, 0
+                    target_angle_deg = math.degrees(math.atan2(target_player.y - enemy.y, target_player.x - enemy.x))
                     
-                    elif getattr(enemy, '_is_miner', False) and distance_to_player < 200 and has_los:
-                        target_dx, target_dy = 0, 0
-                        target_angle_deg = math.degrees(math.atan2(target_player.y - enemy.y, target_player.x - enemy.x))
-                        
-                        if now - enemy._last_shot > enemy._fire_rate:
-                            enemy._last_shot = now
-                            self.game_state.mines.append(Mine(enemy.x, enemy.y, -1, enemy._mine_damage))
+                    if now - enemy._last_shot > enemy._fire_rate:
+                        enemy._last_shot = now
+                        enemy_bullet = Bullet(enemy.x, enemy.y, target_angle_deg, -1)
+                        enemy_bullet.damage = enemy._bullet_damage
+                        enemy_bullet.speed = enemy._bullet_speed
+                        enemy_bullet.color = (255, 0, 0)
+                        enemy_bullet.start_x = enemy.x
+                        enemy_bullet.start_y = enemy.y
+                        self.game_state.bullets.add(enemy_bullet)
+                
+                elif getattr(enemy, '_is_miner', False) and distance_to_player < 200 and has_los:
+                    target_dx, target_dy = 0, 0
+                    target_angle_deg = math.degrees(math.atan2(target_player.y - enemy.y, target_player.x - enemy.x))
                     
-                    else:
-                        # Jeśli nie ma LOS, użyj A*
-                        if not has_los:
-                            next_x, next_y = self.get_astar_path(enemy.x, enemy.y, target_player.x, target_player.y)
-                            angle = math.atan2(next_y - enemy.y, next_x - enemy.x)
-                        else:
-                            angle = math.atan2(target_player.y - enemy.y, target_player.x - enemy.x)
-                        target_dx = math.cos(angle) * enemy.speed
-                        target_dy = math.sin(angle) * enemy.speed
-                        target_angle_deg = math.degrees(angle)
-                        future_x = enemy.x + target_dx * dt
-                        future_y = enemy.y + target_dy * dt
-                        enemy_rect = pygame.Rect(future_x - enemy.size, future_y - enemy.size, enemy.size*2, enemy.size*2)
-                        for wall in self.game_state.walls:
-                            if wall.rect.colliderect(enemy_rect):
-                                target_dx, target_dy = self.find_path_around_wall(enemy, target_player.x, target_player.y, wall)
-                                target_angle_deg = math.degrees(math.atan2(target_dy, target_dx))
-                                break
+                    if now - enemy._last_shot > enemy._fire_rate:
+                        enemy._last_shot = now
+                        self.game_state.mines.append(Mine(enemy.x, enemy.y, -1, enemy._mine_damage))
+                
                 else:
-                    # Patrolowanie gdy nie ma graczy
-                    dx, dy = enemy.get_patrol_vector(dt)
-                    target_dx = dx * enemy.speed
-                    target_dy = dy * enemy.speed
-                    target_angle_deg = math.degrees(math.atan2(dy, dx))
-
-                enemy.look_angle = target_angle_deg
+                    # Jeśli nie ma LOS, użyj A*
+                    if not has_los:
+                        step = self.flow_field.next_step(enemy.x, enemy.y) if self.use_flow_field else None
+                        if step is None:
+                            step = self.get_enemy_waypoint(enemy, target_player.x, target_player.y)
+                        next_x, next_y = step
+                        angle = math.atan2(next_y - enemy.y, next_x - enemy.x)
+                    else:
+                        angle = math.atan2(target_player.y - enemy.y, target_player.x - enemy.x)
+                    target_dx = math.cos(angle) * enemy.speed
+                    target_dy = math.sin(angle) * enemy.speed
+                    target_angle_deg = math.degrees(angle)
+                    future_x = enemy.x + target_dx * dt
+                    future_y = enemy.y + target_dy * dt
+                    enemy_rect = pygame.Rect(future_x - enemy.size, future_y - enemy.size, enemy.size*2, enemy.size*2)
+                    for wall in self.wall_index.query_rect(enemy_rect):
+                        target_dx, target_dy = self.find_path_around_wall(enemy, target_player.x, target_player.y, wall)
+                        target_angle_deg = math.degrees(math.atan2(target_dy, target_dx))
+                        break
+            else:
+                # Patrolowanie gdy nie ma graczy
+                dx, dy = enemy.get_patrol_vector(dt)
+                target_dx = dx * enemy.speed
+                target_dy = dy * enemy.speed
+                target_angle_deg = math.degrees(math.atan2(dy, dx))
 
-                # Zastosuj ruch z płynnym przejściem
-                enemy.x += target_dx * dt
-                enemy.y += target_dy * dt
+            enemy.look_angle = target_angle_deg
 
-                # Sprawdź kolizje z graczem
-                if target_player and ((enemy.x - target_player.x) ** 2 + (enemy.y - target_player.y) ** 2) ** 0.5 < enemy.size + target_player.size:
-                    target_player.take_damage(enemy.damage)
-                    if target_player.health <= 0 and not target_player.dead:
-                        target_player.kill()
+            # Zastosuj ruch z płynnym przejściem
+            enemy.x += target_dx * dt
+            enemy.y += target_dy * dt
 
-            # Usuń zniszczone ściany po przetworzeniu wszystkich wrogów
-            self.game_state.walls = [wall for wall in self.game_state.walls if wall.health > 0]
+            # Sprawdź kolizje z graczem
+            if target_player and ((enemy.x - target_player.x) ** 2 + (enemy.y - target_player.y) ** 2) ** 0.5 < enemy.size + target_player.size:
+                # Obrażenia kontaktowe są podane na klatkę przy 60 Hz, jak prędkości
+                target_player.take_damage(enemy.damage * frame_scale)
+                if target_player.health <= 0 and not target_player.dead:
+                    target_player.kill()
 
-            time.sleep(1/60)  # 60 FPS
+        # Usuń zniszczone ściany po przetworzeniu wszystkich wrogów
+        for wall in [w for w in self.game_state.walls if w.health <= 0]:
+            self.remove_wall(wall)
 
-    def broadcast_game_state(self):
+    async def broadcast_game_state(self):
         while self.running:
-            for client in self.clients.values():
-                try:
-                    NetworkProtocol.send_message(client, {
-                        'type': 'game_state',
-                        'data': self.game_state.to_dict()
-                    })
-                except:
-                    pass
-            time.sleep(1/30)  # 30 FPS for network updates
+            self.broadcast_snapshot()
+            if self.udp is not None:
+                self.udp.poll()
+            await asyncio.sleep(1 / self.broadcast_rate)
 
-    def run(self):
-        # Start game state update thread
-        update_thread = threading.Thread(target=self.update_game_state)
-        update_thread.start()
+    def broadcast_snapshot(self):
+        # Jeden snapshot na tick rozgłaszania, z którego każdy klient dostaje
+        # swój wycinek (obszar zainteresowania). Wysyłamy deltę względem
+        # ostatniego potwierdzonego widoku albo pełny widok, jeśli jego baza
+        # wypadła z historii
+        self.snapshot_seq += 1
+        snapshot = self.game_state.to_dict()
+        snapshot['seq'] = self.snapshot_seq
+        snapshot['time'] = self.sim_time_ms
+        now = time.monotonic()
+        grids = self.snapshot_grids(snapshot)
+        # Rekordy graczy są wspólne dla wszystkich widoków: kodujemy każdy
+        # raz na rozgłoszenie, przy pierwszej wiadomości, która go zawiera
+        encoded_players = {}
+        for player_id, client in list(self.clients.items()):
+            stalled = client.saturated_for(now)
+            if stalled > self.send_stall_timeout:
+                print(f"Disconnecting player {player_id}: send buffer full for {stalled:.1f}s "
+                      f"({client.transport.get_write_buffer_size()} bytes queued, {client.dropped_snapshots} snapshots dropped)")
+                client.abort()
+                continue
+            protocol = self.client_protocols.get(player_id, PROTOCOL_BINARY)
+            view = self.view_for_client(player_id, snapshot, grids)
+            history = self.client_snapshots.setdefault(player_id, {})
+            baseline = history.get(self.client_acks.get(player_id, 0))
+            history[self.snapshot_seq] = view
+            history.pop(self.snapshot_seq - SNAPSHOT_HISTORY, None)
+            try:
+                if baseline:
+                    message = {'type': 'game_state_delta', 'data': SnapshotDelta.make(baseline, view)}
+                else:
+                    message = {'type': 'game_state', 'data': view}
+                data = message['data']
+                if protocol == PROTOCOL_BINARY and data['players']:
+                    players = {}
+                    for pid, p in data['players'].items():
+                        if pid not in encoded_players:
+                            encoded_players[pid] = wire.PLAYER.preencode(p)
+                        players[pid] = encoded_players[pid]
+                    data = dict(data, players=players)
+                client.send_snapshot(NetworkProtocol.create_message(message['type'], data, protocol))
+            except Exception as e:
+                print(f"Error sending snapshot to player {player_id}: {e}")
+
+    def snapshot_grids(self, snapshot):
+        # Siatki budowane raz na snapshot i współdzielone przez widoki klientów
+        grids = {}
+        for name in ('enemies', 'bullets', 'lootboxes', 'mines', 'pickups'):
+            grid = grids[name] = SnapshotGrid()
+            for item in snapshot[name]:
+                grid.insert(item, item['x'], item['y'], item['x'], item['y'])
+        grid = grids['walls'] = SnapshotGrid()
+        for w in snapshot['walls']:
+            grid.insert(w, w['x'], w['y'], w['x'] + w['width'], w['y'] + w['height'])
+        return grids
+
+    def view_for_client(self, player_id, snapshot, grids=None):
+        player = snapshot['players'].get(player_id)
+        if player is None:
+            return snapshot
+        if grids is None:
+            grids = self.snapshot_grids(snapshot)
+        px, py = player['x'], player['y']
+        near = self.aoi_radius
+        far = self.minimap_radius
 
-        # Start broadcast thread
-        broadcast_thread = threading.Thread(target=self.broadcast_game_state)
-        broadcast_thread.start()
+        def within(item, radius):
+            return abs(item['x'] - px) <= radius and abs(item['y'] - py) <= radius
 
+        view = dict(snapshot)
+        # Wrogowie: pełne rekordy przy graczu, dalej tylko punkty na minimapę
+        enemies = []
+        radar = []
+        for enemy in grids['enemies'].query(px - far, py - far, px + far, py + far):
+            if within(enemy, near):
+                enemies.append(enemy)
+            elif within(enemy, far):
+                radar.append({'x': int(enemy['x']), 'y': int(enemy['y'])})
+        view['enemies'] = enemies
+        view['radar'] = radar
+        for name in ('bullets', 'lootboxes', 'mines', 'pickups'):
+            view[name] = [item for item in grids[name].query(px - near, py - near, px + near, py + near)
+                          if within(item, near)]
+        # Ściany są rysowane na minimapie, więc wysyłamy wszystkie w jej zasięgu
+        view['walls'] = [w for w in grids['walls'].query(px - far, py - far, px + far, py + far)
+                         if w['x'] <= px + far and w['x'] + w['width'] >= px - far
+                         and w['y'] <= py + far and w['y'] + w['height'] >= py - far]
+        return view
+
+    def run(self):
         try:
-            while self.running:
-                client_socket, address = self.server.accept()
-                print(f"New connection from {address}")
-                client_thread = threading.Thread(target=self.handle_client,
-                                              args=(client_socket, address))
-                client_thread.start()
+            asyncio.run(self.serve())
         except KeyboardInterrupt:
+            pass
+        finally:
             self.running = False
             self.server.close()
 
+    async def serve(self):
+        # Jedna pętla zdarzeń: przyjmowanie połączeń, odczyt ramek, symulacja
+        # i rozsyłanie snapshotów, zamiast wątku na klienta
+        loop = asyncio.get_running_loop()
+        listener = await loop.create_server(lambda: ClientConnection(self), sock=self.server, backlog=LISTEN_BACKLOG)
+        if self.udp_port is not None:
+            _, self.udp = await loop.create_datagram_endpoint(lambda: UdpEndpoint(self), local_addr=(self.host, self.udp_port))
+            print(f"UDP transport on port {self.udp.port}")
+        try:
+            await asyncio.gather(self.update_game_state(), self.broadcast_game_state())
+        finally:
+            listener.close()
+            if self.udp is not None:
+                self.udp.transport.close()
+            for client in list(self.clients.values()):
+                client.close()
+
     def is_in_boss_room(self, x, y):
         # Sprawdź czy pozycja jest w jednym z pokoi bossa
         boss_rooms = [
@@ -804,5 +1631,5 @@ class GameServer:
         return False
 
 if __name__ == "__main__":
-    server = GameServer()
+    server = GameServer(udp_port=5556)
     server.run() 
\ No newline at end of file
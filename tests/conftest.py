@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# Moduły gry (server, client, common) leżą w katalogu głównym repozytorium
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import GameServer
+
+@pytest.fixture
+def make_server():
+    # Serwer bez nasłuchiwania: testy wołają tick i handle_message wprost
+    def make(**kwargs):
+        server = GameServer(host='127.0.0.1', port=0, **kwargs)
+        server.server.close()
+        return server
+    return make
+
+@pytest.fixture
+def server(make_server):
+    return make_server()
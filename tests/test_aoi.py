@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+from common import wire
+from common.game_objects import Player, Enemy, LootBox, Mine, Pickup, Wall, WEAPON_LIST
+from common.network import NetworkProtocol
+
+@pytest.fixture
+def server(server):
+    rng = random.Random(5)
+    state = server.game_state
+    for pid in range(4):
+        state.players[pid] = Player(rng.uniform(0, 4000), rng.uniform(0, 3000), pid)
+    for _ in range(200):
+        state.enemies.append(Enemy(rng.uniform(0, 4000), rng.uniform(0, 3000), rng.randint(1, 4)))
+    for _ in range(200):
+        state.bullets.spawn(rng.uniform(0, 4000), rng.uniform(0, 3000), 0.0, rng.randrange(4))
+    for _ in range(20):
+        state.lootboxes.append(LootBox(rng.uniform(0, 4000), rng.uniform(0, 3000), rng.choice(WEAPON_LIST[1:])))
+        state.mines.append(Mine(rng.uniform(0, 4000), rng.uniform(0, 3000), -1, 100))
+        state.pickups.append(Pickup(rng.uniform(0, 4000), rng.uniform(0, 3000), 'health', 50))
+        server.add_wall(Wall(rng.randrange(0, 4000), rng.randrange(0, 3000), rng.randrange(20, 600), 40, is_player_wall=True))
+    return server
+
+def brute_force_view(server, player_id, snapshot):
+    # Widok liczony przeglądaniem całych list (stara wersja view_for_client)
+    player = snapshot['players'][player_id]
+    px, py = player['x'], player['y']
+    near, far = server.aoi_radius, server.minimap_radius
+
+    def within(item, radius):
+        return abs(item['x'] - px) <= radius and abs(item['y'] - py) <= radius
+
+    view = dict(snapshot)
+    view['enemies'] = [e for e in snapshot['enemies'] if within(e, near)]
+    view['radar'] = [{'x': int(e['x']), 'y': int(e['y'])} for e in snapshot['enemies']
+                     if not within(e, near) and within(e, far)]
+    for name in ('bullets', 'lootboxes', 'mines', 'pickups'):
+        view[name] = [item for item in snapshot[name] if within(item, near)]
+    view['walls'] = [w for w in snapshot['walls']
+                     if w['x'] <= px + far and w['x'] + w['width'] >= px - far
+                     and w['y'] <= py + far and w['y'] + w['height'] >= py - far]
+    return view
+
+def test_grid_view_matches_full_scan(server):
+    snapshot = dict(server.game_state.to_dict(), seq=1, time=0.0)
+    grids = server.snapshot_grids(snapshot)
+    for player_id in snapshot['players']:
+        assert server.view_for_client(player_id, snapshot, grids) == brute_force_view(server, player_id, snapshot)
+
+def test_preencoded_players_match_plain_encoding(server):
+    snapshot = dict(server.game_state.to_dict(), seq=1, time=0.0)
+    view = server.view_for_client(0, snapshot)
+    players = {pid: wire.PLAYER.preencode(p) for pid, p in view['players'].items()}
+    payload = NetworkProtocol.create_message('game_state', dict(view, players=players))
+    assert payload == NetworkProtocol.create_message('game_state', view)
+    assert NetworkProtocol.parse_message(payload)['data']['players'][0]['x'] == pytest.approx(view['players'][0]['x'])
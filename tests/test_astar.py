@@ -0,0 +1,105 @@
+import math
+import heapq
+
+import pytest
+
+# Małe siatki: '#' ściana, '.' wolne; grid[x][y] jak w NavGrid
+MAPS = {
+    'open': [
+        "......",
+        "......",
+        "......",
+        "......",
+    ],
+    'wall_with_gap': [
+        "..#.....",
+        "..#.###.",
+        "..#...#.",
+        "..###.#.",
+        "......#.",
+    ],
+    'corridor': [
+        ".#......",
+        ".#.####.",
+        ".#.#..#.",
+        ".#.#.##.",
+        "...#....",
+    ],
+}
+
+def parse(rows):
+    grid_w, grid_h = len(rows[0]), len(rows)
+    grid = [[1 if rows[y][x] == '#' else 0 for y in range(grid_h)] for x in range(grid_w)]
+    return grid, grid_w, grid_h
+
+def moves(diagonal):
+    straight = [(-1, 0, 1), (1, 0, 1), (0, -1, 1), (0, 1, 1)]
+    if not diagonal:
+        return straight
+    return straight + [(dx, dy, math.sqrt(2)) for dx in (-1, 1) for dy in (-1, 1)]
+
+def allowed(grid, grid_w, grid_h, cx, cy, dx, dy):
+    nx, ny = cx + dx, cy + dy
+    if not (0 <= nx < grid_w and 0 <= ny < grid_h) or grid[nx][ny]:
+        return False
+    # Bez ścinania rogów, jak w GameServer.astar
+    return not (dx and dy and (grid[cx + dx][cy] or grid[cx][cy + dy]))
+
+def reference_cost(start, goal, grid, grid_w, grid_h, diagonal):
+    # Dijkstra: koszt najkrótszej ścieżki albo None
+    dist = {start: 0}
+    queue = [(0, start)]
+    while queue:
+        cost, (cx, cy) = heapq.heappop(queue)
+        if (cx, cy) == goal:
+            return cost
+        if cost > dist[(cx, cy)]:
+            continue
+        for dx, dy, step in moves(diagonal):
+            if allowed(grid, grid_w, grid_h, cx, cy, dx, dy):
+                neighbor = (cx + dx, cy + dy)
+                if cost + step < dist.get(neighbor, float('inf')):
+                    dist[neighbor] = cost + step
+                    heapq.heappush(queue, (cost + step, neighbor))
+    return None
+
+def path_cost(path, grid, grid_w, grid_h, diagonal):
+    cost = 0
+    for (cx, cy), (nx, ny) in zip(path, path[1:]):
+        dx, dy = nx - cx, ny - cy
+        assert (dx, dy) in [(mx, my) for mx, my, _ in moves(diagonal)]
+        assert allowed(grid, grid_w, grid_h, cx, cy, dx, dy)
+        cost += math.sqrt(2) if dx and dy else 1
+    return cost
+
+@pytest.mark.parametrize('diagonal', [False, True])
+@pytest.mark.parametrize('name', sorted(MAPS))
+def test_paths_are_valid_and_optimal(server, name, diagonal):
+    grid, grid_w, grid_h = parse(MAPS[name])
+    free = [(x, y) for x in range(grid_w) for y in range(grid_h) if not grid[x][y]]
+    for start in free:
+        for goal in free:
+            expected = reference_cost(start, goal, grid, grid_w, grid_h, diagonal)
+            path = server.astar(start, goal, grid, grid_w, grid_h, diagonal=diagonal)
+            if expected is None:
+                assert path is None
+                continue
+            assert path[0] == start and path[-1] == goal
+            assert path_cost(path, grid, grid_w, grid_h, diagonal) == pytest.approx(expected)
+
+@pytest.mark.parametrize('diagonal', [False, True])
+def test_walled_off_target_has_no_path(server, diagonal):
+    grid, grid_w, grid_h = parse([
+        "........",
+        "....###.",
+        "....#.#.",
+        "....###.",
+        "........",
+    ])
+    assert server.astar((0, 0), (5, 2), grid, grid_w, grid_h, diagonal=diagonal) is None
+    # Cel w ścianie jest osiągalny (gracz stojący przy ścianie)
+    assert server.astar((0, 0), (4, 2), grid, grid_w, grid_h, diagonal=diagonal)[-1] == (4, 2)
+
+def test_expansion_cap_gives_up(server):
+    grid, grid_w, grid_h = parse(MAPS['open'])
+    assert server.astar((0, 0), (5, 3), grid, grid_w, grid_h, max_expansions=2) is None
@@ -0,0 +1,6 @@
+from benchmarks import bench_wire
+
+def test_wire_benchmark_runs(capsys):
+    # Przykładowe wiadomości benchmarku muszą nadążać za schematami
+    bench_wire.main()
+    assert 'binary AOI' in capsys.readouterr().out
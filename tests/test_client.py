@@ -0,0 +1,24 @@
+import threading
+from collections import deque
+
+from client import GameClient
+from common.network import SNAPSHOT_HISTORY
+
+def snapshot(seq):
+    return {'seq': seq, 'time': seq * 50.0, 'players': {}, 'enemies': [], 'bullets': [], 'lootboxes': [],
+            'mines': [], 'pickups': [], 'walls': [], 'game_over': False, 'wave': 1, 'wave_cooldown': 0.0,
+            'scores': {}, 'radar': []}
+
+def test_snapshot_history_is_bounded_when_seqs_are_skipped():
+    # Sam odbiór snapshotów, bez łączenia z serwerem
+    client = GameClient.__new__(GameClient)
+    client.receive_lock = threading.Lock()
+    client.snapshots = {}
+    client.last_snapshot_seq = 0
+    client.incoming = deque(maxlen=16)
+    # Co trzeci datagram zgubiony, w tym te, które przycinały historię po seq
+    received = [seq for seq in range(1, 500) if seq % 3]
+    for seq in received:
+        client.handle_message({'type': 'game_state', 'data': snapshot(seq)})
+        assert min(client.snapshots) > seq - SNAPSHOT_HISTORY
+    assert sorted(client.snapshots) == [seq for seq in received if seq > received[-1] - SNAPSHOT_HISTORY]
@@ -0,0 +1,59 @@
+import pytest
+
+from common.game_objects import Player
+from common.network import NetworkProtocol
+
+@pytest.fixture
+def server(server):
+    # Bez fal: losowo rozstawieni strzelający wrogowie dodawaliby pociski
+    server.wave_in_progress = True
+    server.zombies_to_spawn = 0
+    server.game_state.players[0] = Player(2000, 1500, 0)
+    server.player_inputs[0] = {'dx': 0, 'dy': 0, 'angle': 0, 'shoot': False, 'mouse_x': 0, 'mouse_y': 0}
+    return server
+
+def test_input_ticks_saturate_at_the_wire_limit(server):
+    player = server.game_state.players[0]
+    server.player_inputs[0] = {'seq': 5, 'dx': 0, 'dy': 0, 'angle': 0, 'shoot': False}
+    player.last_input_seq = 5
+    player.input_ticks = 0xFFFE
+    for _ in range(3):
+        server.tick(1 / 60)
+    assert player.input_ticks == 0xFFFF
+    snapshot = dict(server.game_state.to_dict(), seq=1, time=0.0)
+    payload = NetworkProtocol.create_message('game_state', snapshot)
+    assert NetworkProtocol.parse_message(payload)['data']['players'][0]['input_ticks'] == 0xFFFF
+
+def test_input_sent_while_dead_replaces_the_pre_death_input(server):
+    player = server.game_state.players[0]
+    server.handle_message(0, {'type': 'player_input', 'data': {
+        'seq': 1, 'dx': 1, 'dy': 0, 'angle': 0, 'shoot': True, 'mouse_x': 0, 'mouse_y': 0, 'ack': 0}})
+    player.kill()
+    server.handle_message(0, {'type': 'player_input', 'data': {
+        'seq': 2, 'dx': 0, 'dy': 0, 'angle': 0, 'shoot': False, 'mouse_x': 0, 'mouse_y': 0, 'ack': 0}})
+    server.tick(1 / 60)
+    player.respawn()
+    x, y = player.x, player.y
+    server.tick(1 / 60)
+    assert (player.x, player.y) == (x, y)
+    assert len(server.game_state.bullets) == 0
+
+def test_batched_inputs_are_applied_once_each_in_seq_order(server):
+    player = server.game_state.players[0]
+
+    def batch(*seqs):
+        return {'type': 'player_inputs', 'data': {'inputs': [
+            {'seq': seq, 'dx': 0, 'dy': 0, 'angle': seq, 'shoot': False, 'mouse_x': 0, 'mouse_y': 0, 'ack': 0}
+            for seq in seqs]}}
+
+    server.handle_message(0, batch(3, 1, 2, 2))
+    applied = []
+    for _ in range(4):
+        server.tick(1 / 60)
+        applied.append(player.last_input_seq)
+    assert applied == [1, 2, 3, 3]
+    # Powtórzone w następnym datagramie wejścia są pomijane
+    server.handle_message(0, batch(2, 3, 4))
+    server.tick(1 / 60)
+    server.tick(1 / 60)
+    assert player.last_input_seq == 4 and player.input_ticks == 2
@@ -0,0 +1,30 @@
+from common.game_objects import Enemy, Wall
+
+def test_failed_search_is_not_repeated_every_tick(server, monkeypatch):
+    searches = []
+    monkeypatch.setattr(server, 'astar', lambda *args, **kwargs: searches.append(args) or None)
+    enemy = Enemy(500, 500, 1)
+    server.game_state.enemies.append(enemy)
+
+    for _ in range(server.path_retry_ticks):
+        assert server.get_enemy_waypoint(enemy, 900, 900) == (900, 900)
+        server.tick_count += 1
+    assert len(searches) == 1
+
+    # Po odczekaniu szukamy ponownie
+    server.get_enemy_waypoint(enemy, 900, 900)
+    assert len(searches) == 2
+
+    # Zmiana ścian unieważnia zapamiętany brak ścieżki
+    server.add_wall(Wall(2000, 2000, 40, 40))
+    server.get_enemy_waypoint(enemy, 900, 900)
+    assert len(searches) == 3
+
+def test_path_state_is_dropped_with_the_enemy(server):
+    enemy = Enemy(500, 500, 1)
+    server.game_state.enemies.append(enemy)
+    server.enemy_index.rebuild(server.game_state.enemies)
+    server.get_enemy_waypoint(enemy, 700, 500)
+    assert enemy.net_id in server.enemy_paths
+    server.remove_enemy(enemy)
+    assert enemy.net_id not in server.enemy_paths
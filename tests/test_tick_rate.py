@@ -0,0 +1,49 @@
+import math
+
+import pygame
+import pytest
+
+from common.game_objects import Player, Enemy
+
+def quiet_server(make_server, tick_rate):
+    server = make_server(tick_rate=tick_rate)
+    # Bez nowych fal: w grze jest tylko to, co doda test
+    server.wave_in_progress = True
+    server.zombies_to_spawn = 0
+    return server
+
+def run(server, tick_rate, seconds):
+    for _ in range(round(seconds * tick_rate)):
+        server.tick(1 / tick_rate)
+
+def free_spot(server):
+    for x in range(200, 3800, 100):
+        for y in range(200, 2800, 100):
+            if not server.wall_index.query_rect(pygame.Rect(x - 150, y - 150, 300, 300)):
+                return x, y
+
+def contact_damage(make_server, tick_rate):
+    server = quiet_server(make_server, tick_rate)
+    x, y = free_spot(server)
+    player = Player(x, y, 0)
+    server.game_state.players[0] = player
+    server.game_state.enemies.append(Enemy(x + 10, y, 1))
+    run(server, tick_rate, 0.25)
+    return 500 - player.health
+
+def stuck_push(make_server, tick_rate):
+    server = quiet_server(make_server, tick_rate)
+    wall = next(w for w in server.game_state.walls if w.rect.width >= 80 and w.rect.height >= 80)
+    start = (wall.rect.centerx + 1, wall.rect.centery)
+    enemy = Enemy(*start, 1)
+    server.game_state.enemies.append(enemy)
+    run(server, tick_rate, 1 / 30)
+    return math.hypot(enemy.x - start[0], enemy.y - start[1])
+
+def test_contact_damage_does_not_depend_on_tick_rate(make_server):
+    assert contact_damage(make_server, 60) > 0
+    assert contact_damage(make_server, 120) == pytest.approx(contact_damage(make_server, 60))
+
+def test_stuck_enemy_push_does_not_depend_on_tick_rate(make_server):
+    assert stuck_push(make_server, 60) > 0
+    assert stuck_push(make_server, 120) == pytest.approx(stuck_push(make_server, 60))
@@ -0,0 +1,68 @@
+import heapq
+import itertools
+
+import pytest
+
+from common.network import UdpChannel, LossyLink, MAX_DATAGRAM_SIZE, UDP_HEADER
+from common.wire import WireError
+
+def test_datagrams_stay_under_the_size_cap():
+    channel = UdpChannel()
+    largest = bytes(MAX_DATAGRAM_SIZE - UDP_HEADER.size)
+    assert len(channel.unreliable(largest)) == MAX_DATAGRAM_SIZE
+    assert len(channel.reliable(largest, 0.0)) == MAX_DATAGRAM_SIZE
+    with pytest.raises(WireError):
+        channel.unreliable(largest + b'x')
+
+def test_oversized_reliable_message_is_not_queued():
+    channel = UdpChannel()
+    with pytest.raises(WireError):
+        channel.reliable(bytes(MAX_DATAGRAM_SIZE), 0.0)
+    assert channel.unacked == {} and channel.next_seq == 1
+    assert channel.poll(1.0) == []
+
+class Clock:
+    # Symulowany czas dla LossyLink: opóźnione datagramy czekają w kopcu
+    def __init__(self):
+        self.now = 0.0
+        self.events = []
+        self.order = itertools.count()
+
+    def call_later(self, delay, callback, *args):
+        heapq.heappush(self.events, (self.now + delay, next(self.order), callback, args))
+
+    def advance(self, dt):
+        self.now += dt
+        while self.events and self.events[0][0] <= self.now:
+            _, _, callback, args = heapq.heappop(self.events)
+            callback(*args)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_reliable_delivery_over_a_lossy_reordering_link(seed):
+    clock = Clock()
+    sender, receiver = UdpChannel(), UdpChannel()
+    delivered = []
+    reordered = []
+
+    def deliver(datagram):
+        delivered.extend(receiver.receive(datagram))
+        reordered.append(bool(receiver.early))
+
+    # Rozrzut opóźnienia większy niż odstęp wysyłania, więc datagramy się wyprzedzają
+    to_receiver = LossyLink(deliver, loss=0.3, latency=0.02, jitter=0.05, call_later=clock.call_later, seed=seed)
+    to_sender = LossyLink(sender.receive, loss=0.3, latency=0.02, jitter=0.05, call_later=clock.call_later, seed=seed + 100)
+    messages = [b'message %d' % i for i in range(200)]
+    pending = list(messages)
+    for _ in range(5000):
+        if pending:
+            to_receiver(sender.reliable(pending.pop(0), clock.now))
+        clock.advance(0.01)
+        for datagram in sender.poll(clock.now):
+            to_receiver(datagram)
+        for datagram in receiver.poll(clock.now):
+            to_sender(datagram)
+        if not pending and not sender.unacked:
+            break
+    assert delivered == messages
+    assert sender.unacked == {}
+    assert to_receiver.dropped and to_sender.dropped and any(reordered)
@@ -0,0 +1,129 @@
+import struct
+
+import pytest
+
+from common import wire
+from common.wire import encode_message, decode_message, WireError
+
+# Wartości dokładnie reprezentowalne we float32, żeby porównywać wprost
+PLAYER = {
+    'x': 120.5, 'y': 2980.25, 'angle': -45.0, 'health': 100.0, 'armor': 0.0,
+    'selected_weapon_index': 1, 'dead': False, 'respawn_timer': 0.0,
+    'last_input_seq': 4294967295, 'input_ticks': 65535,
+    'weapons': ['Pistol', 'Shotgun'],
+    'ammo': {'Pistol': float('inf'), 'Shotgun': 12},
+}
+ENEMY = {'id': 7, 'x': 1.5, 'y': 2.5, 'health': 80.0, 'type': 4, 'look_angle': 90.0}
+BULLET = {'id': 8, 'x': 3.0, 'y': 4.0, 'angle': 0.5, 'player_id': -1, 'color': (255, 128, 0)}
+LOOTBOX = {'id': 9, 'x': 5.0, 'y': 6.0, 'weapon': 'Bazooka'}
+MINE = {'id': 10, 'x': 7.0, 'y': 8.0, 'owner_id': 2, 'damage': 150.0, 'active': True}
+PICKUP = {'id': 11, 'x': 9.0, 'y': 10.0, 'pickup_type': 'health', 'value': 50.0}
+WALL = {'id': 12, 'x': -20, 'y': 3000, 'width': 40, 'height': 40, 'is_player_wall': True, 'health': 25.0}
+RADAR = {'x': -32768, 'y': 32767}
+
+SAMPLES = {
+    'game_state': {
+        'seq': 1, 'time': 1700000000123.25,
+        'players': {0: PLAYER, 2: dict(PLAYER, dead=True, weapons=['Pistol'], ammo={'Pistol': float('inf')})},
+        'enemies': [ENEMY], 'bullets': [BULLET, dict(BULLET, id=13)], 'lootboxes': [LOOTBOX],
+        'mines': [MINE], 'pickups': [PICKUP], 'walls': [WALL],
+        'game_over': False, 'wave': 65535, 'wave_cooldown': 2.5,
+        'scores': {0: 1500, 2: 0}, 'radar': [RADAR],
+    },
+    'game_state_delta': {
+        'seq': 5, 'time': 0.0, 'baseline': 3,
+        'players': {1: PLAYER}, 'removed_players': [0],
+        'enemies': {'removed': [1, 2], 'changed': [ENEMY]},
+        'bullets': {'removed': [], 'changed': [BULLET]},
+        'lootboxes': {'removed': [300], 'changed': []},
+        'mines': {'removed': [], 'changed': [MINE]},
+        'pickups': {'removed': [], 'changed': [PICKUP]},
+        'walls': {'removed': [2 ** 32 - 1], 'changed': [WALL]},
+        'game_over': True, 'wave': 0, 'wave_cooldown': 0.0,
+        'scores': {}, 'radar': [],
+    },
+    'player_input': {'seq': 1, 'dx': 0.70709228515625, 'dy': -1.0, 'angle': 180.0, 'shoot': True,
+                     'mouse_x': 812.5, 'mouse_y': 440.0, 'ack': 0},
+    'player_inputs': {'inputs': [
+        {'seq': 2, 'dx': 0.0, 'dy': 1.0, 'angle': 90.0, 'shoot': False, 'mouse_x': 0.0, 'mouse_y': 0.0, 'ack': 7},
+        {'seq': 3, 'dx': -1.0, 'dy': 0.0, 'angle': 180.0, 'shoot': True, 'mouse_x': 12.5, 'mouse_y': 40.0, 'ack': 8},
+    ]},
+    'switch_weapon': {'selected_weapon_index': 255},
+    'switch_weapon_ack': {'selected_weapon_index': 0},
+    'restart_game': {},
+    'join': {'player_id': -1, 'udp_port': 65535, 'udp_token': 2 ** 32 - 1, 'map_hash': 'a' * 40},
+    'join_ack': {'have_map': True},
+    'static_map': {'walls': [WALL] * 3},
+    'udp_hello': {'token': 0},
+}
+
+def test_every_message_type_has_a_sample():
+    assert set(SAMPLES) == set(wire.MESSAGE_TYPES)
+
+@pytest.mark.parametrize('message_type', sorted(SAMPLES))
+def test_round_trip(message_type):
+    data = SAMPLES[message_type]
+    decoded = decode_message(encode_message(message_type, data))
+    assert decoded['type'] == message_type
+    assert decoded['data'] == data
+
+@pytest.mark.parametrize('record, base, field, low, high', [
+    (wire.RADAR, RADAR, 'x', -32768, 32767),
+    (wire.RADAR, RADAR, 'y', -32768, 32767),
+    (wire.WEAPON_INDEX, SAMPLES['switch_weapon'], 'selected_weapon_index', 0, 255),
+    (wire.PLAYER, PLAYER, 'selected_weapon_index', 0, 255),
+    (wire.PLAYER, PLAYER, 'input_ticks', 0, 65535),
+    (wire.GAME_STATE, SAMPLES['game_state'], 'wave', 0, 65535),
+    (wire.PLAYER_INPUT, SAMPLES['player_input'], 'seq', 0, 2 ** 32 - 1),
+    (wire.ENEMY, ENEMY, 'type', 0, 255),
+    (wire.BULLET, BULLET, 'player_id', -32768, 32767),
+    (wire.JOIN, SAMPLES['join'], 'udp_port', 0, 65535),
+])
+def test_packed_field_boundaries(record, base, field, low, high):
+    for value in (low, high):
+        buf = bytearray()
+        record.encode(buf, dict(base, **{field: value}))
+        decoded, end = record.decode(buf, 0)
+        assert decoded[field] == value and end == len(buf)
+    for value in (low - 1, high + 1):
+        with pytest.raises(struct.error):
+            record.encode(bytearray(), dict(base, **{field: value}))
+
+@pytest.mark.parametrize('value', [0, 1, 127, 128, 16383, 16384, 2 ** 32, 2 ** 63 - 1])
+def test_varint(value):
+    buf = bytearray()
+    wire.write_varint(buf, value)
+    assert wire.read_varint(buf, 0) == (value, len(buf))
+
+@pytest.mark.parametrize('value', [0, -1, 1, -64, 64, -2 ** 31, 2 ** 31 - 1])
+def test_svarint(value):
+    buf = bytearray()
+    wire.SVarint().encode(buf, value)
+    assert wire.SVarint().decode(buf, 0) == (value, len(buf))
+
+def test_fixed_record_lists_round_trip():
+    bullets = [dict(BULLET, id=i, color=(i % 256, 0, 255)) for i in range(300)]
+    kind = wire.ListOf(wire.BULLET)
+    buf = bytearray()
+    kind.encode(buf, bullets)
+    assert kind.decode(buf, 0) == (bullets, len(buf))
+
+@pytest.mark.parametrize('message_type', sorted(set(SAMPLES) - {'restart_game'}))
+def test_truncated_payload_is_rejected(message_type):
+    payload = encode_message(message_type, SAMPLES[message_type])
+    with pytest.raises(WireError):
+        decode_message(payload[:-1])
+
+def test_invalid_input_is_rejected():
+    with pytest.raises(WireError):
+        decode_message(b'')
+    with pytest.raises(WireError):
+        decode_message(bytes((200,)))
+    with pytest.raises(WireError):
+        encode_message('no_such_message', {})
+    with pytest.raises(WireError):
+        wire.WeaponName().decode(bytes((len(wire.WeaponName.names),)), 0)
+
+def test_decodes_from_memoryview():
+    payload = encode_message('game_state', SAMPLES['game_state'])
+    assert decode_message(memoryview(bytearray(payload)))['data'] == SAMPLES['game_state']